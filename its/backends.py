@@ -1,8 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
 from djangocas.backends import CASBackend
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from arcutils.ldap import ldapsearch, parse_profile, escape
+from arcutils.ldap import parse_profile, escape
+from its.ldap import ldapsearch, TTLCache
 from its.items.forms import create_user
-import re
+
+
+# Groups whose members can log in, as lab attendants or as staff
+STUDENT_GROUPS = set(["ITS_LAB_STUDENTS_GG"])
+STAFF_GROUPS = set(["ITS_CAVS_STAFF_GG", "TLC_GG"])
+
+# Runs the two login searches side by side
+search_executor = ThreadPoolExecutor(max_workers=4)
+
+# username -> the profile and role found at the user's last login
+role_cache = TTLCache(settings.LOGIN_ROLE_CACHE_TTL)
+
+
+def group_names(member_of):
+
+    """
+    The upper cased common names of the groups in a memberOf attribute, so
+    "CN=TLC_GG,OU=Groups,DC=psu,DC=ds,DC=pdx,DC=edu" becomes "TLC_GG".
+    """
+
+    names = set()
+
+    for dn in member_of:
+        rdn = dn.split(",", 1)[0]
+
+        if "=" in rdn:
+            attribute, value = rdn.split("=", 1)
+
+            if attribute.strip().upper() == "CN":
+                names.add(value.strip().upper())
+
+    return names
 
 
 class ITSBackend(CASBackend):
@@ -11,40 +45,53 @@ class ITSBackend(CASBackend):
     Custom backend, allows for use of CAS and AD user lookups.
     """
 
-    # Override
-    def get_or_init_user(self, username):
-        username = escape(username)
+    def lookup_role(self, username):
+
+        """
+        Search AD for the user's profile and groups, and the arc group for the
+        backdoor, at the same time. Returns the user's first name, last name,
+        email, whether they are a lab attendant and whether they are staff.
+        """
+
         query = "(cn=" + username + ")"
-        results = ldapsearch(query, using='groups')
+        results = search_executor.submit(ldapsearch, query, using='groups')
         # create a backdoor for people in the arc group
         ldap_query = "(& (memberuid=" + username + ") (cn=arc))"
-        ldap_results = ldapsearch(ldap_query)
+        ldap_results = search_executor.submit(ldapsearch, ldap_query)
+
+        results = results.result()
+        ldap_results = ldap_results.result()
+
+        if not results:
+            return None
 
         # Get the list of groups that the user belongs too.
-        memberOf = results[0][1]['memberOf']
+        groups = group_names(results[0][1].get('memberOf', []))
 
         # Add the username as a list for the uid dictionary key.
         results[0][1]['uid'] = [username]
 
         user_info = parse_profile(results[0][1])
-        first_name = user_info['first_name']
-        last_name = user_info['last_name']
-        email = user_info['email']
 
-        staff = False
-        student = False
+        student = bool(groups & STUDENT_GROUPS)
+        staff = bool(groups & STAFF_GROUPS) or bool(ldap_results)
+
+        return (user_info['first_name'], user_info['last_name'], user_info['email'], student, staff)
+
+    # Override
+    def get_or_init_user(self, username):
+        username = escape(username)
+        role = role_cache.get(username)
 
-        if re.search("(CN=ITS_LAB_Students_GG)", str(memberOf)):
-            student = True
+        if role is None:
+            role = self.lookup_role(username)
 
-        if re.search("(CN=ITS_CAVS_Staff_GG)", str(memberOf)):
-            staff = True
+            if role is None:
+                return None
 
-        if re.search("(CN=TLC_GG)", str(memberOf)):
-            staff = True
+            role_cache.set(username, role)
 
-        if ldap_results:
-            staff = True
+        first_name, last_name, email, student, staff = role
 
         if student or staff:
             User = get_user_model()
@@ -55,10 +102,11 @@ class ITSBackend(CASBackend):
                 user = User(first_name=first_name, last_name=last_name, email=email, username=username)
 
             # Always need to reset the users permissions, to stay up to date with
-            # group changes.
-            user.is_active = True
-            user.is_staff = staff
-            user.save()
+            # group changes. Only write the row when they actually changed.
+            if user.pk is None or not user.is_active or user.is_staff != staff:
+                user.is_active = True
+                user.is_staff = staff
+                user.save()
 
             return user
 
@@ -1,15 +0,0 @@
-# uncomment this file to use celery stuff
-#from __future__ import absolute_import
-#import os
-#from celery import Celery
-#from django.conf import settings
-#
-## set the default Django settings module for the 'celery' program.
-#os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'its.settings')
-#
-#app = Celery('proj')
-#
-## Using a string here means the worker will not have to
-## pickle the object when using Windows.
-#app.config_from_object('django.conf:settings')
-#app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from arcutils.ldap import escape, parse_profile
+from its.ldap import ldapsearch
+from its.users.models import DirectoryEntry
+
+
+class PrefixCache:
+
+    """
+    A least recently used cache of search results keyed by the query prefix,
+    with entries expiring after a fixed number of seconds.
+
+    An entry is complete when the search returned every match. A longer query
+    that extends the prefix of a complete entry is answered by filtering that
+    entry's rows, without searching again.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # prefix -> (expires at, complete, rows)
+        self.entries = OrderedDict()
+
+    def get(self, prefix):
+
+        """
+        The rows for prefix as (key, value) pairs sorted by key, or None if
+        they aren't cached.
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            for length in range(len(prefix), 0, -1):
+                entry = self.entries.get(prefix[:length])
+
+                if entry is None:
+                    continue
+
+                expires_at, complete, rows = entry
+
+                if expires_at <= now:
+                    del self.entries[prefix[:length]]
+                    continue
+
+                if length == len(prefix):
+                    self.entries.move_to_end(prefix)
+                    return rows
+
+                if complete:
+                    self.entries.move_to_end(prefix[:length])
+                    return [row for row in rows if row[0].startswith(prefix)]
+
+        return None
+
+    def set(self, prefix, rows, complete):
+        with self.lock:
+            self.entries[prefix] = (time.monotonic() + self.ttl, complete, rows)
+            self.entries.move_to_end(prefix)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = PrefixCache(settings.AUTOCOMPLETE_CACHE_SIZE, settings.AUTOCOMPLETE_CACHE_TTL)
+
+
+def search_people(query, limit):
+
+    """
+    The profiles of the first limit people whose username starts with query,
+    sorted by username, as (username, profile) pairs. They come from the
+    local copy of the directory if USE_DIRECTORY_MIRROR is set, or from LDAP
+    through the cache otherwise.
+    """
+
+    prefix = query.lower()
+
+    if settings.USE_DIRECTORY_MIRROR:
+        return [(entry.uid, entry.profile()) for entry in DirectoryEntry.objects.filter(uid__startswith=prefix)[:limit]]
+
+    rows = cache.get(prefix)
+
+    if rows is None:
+        search_limit = settings.AUTOCOMPLETE_SEARCH_LIMIT
+        results = ldapsearch('(uid={q}*)'.format(q=escape(query)), size_limit=search_limit)
+
+        # I don't think LDAP guarantees the sort order, so we have to sort ourselves
+        rows = sorted(((result[1]['uid'][0].lower(), parse_profile(result[1])) for result in results), key=lambda row: row[0])
+        cache.set(prefix, rows, complete=len(rows) < search_limit)
+
+    return rows[:limit]
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from its.items.models import Status, ValuableItemNotice, archive_items
+from its.items import emails
+from its.jobs.models import enqueue_once
+from its.jobs.outbox import queue_email
+
+
+def add_to_digest(*statuses):
+
+    """
+    Hold the staff emails for valuable items' new statuses back for the next
+    digest, which goes out VALUABLE_ITEM_DIGEST_WINDOW seconds after the
+    first status that is waiting for it.
+    """
+
+    if not statuses:
+        return
+
+    ValuableItemNotice.objects.bulk_create([ValuableItemNotice(status=status) for status in statuses])
+    enqueue_once(send_valuable_digest, delay=timedelta(seconds=settings.VALUABLE_ITEM_DIGEST_WINDOW))
+
+
+def send_valuable_digest():
+
+    """
+    Put one digest email in the outbox for all the statuses waiting for it.
+    The statuses and everything the email shows about their items are
+    loaded in a single query. Items that were archived while they waited
+    are moved into the archive tables afterwards. Returns the number of
+    statuses sent.
+    """
+
+    with transaction.atomic():
+        notices = list(ValuableItemNotice.objects.raw(
+            "SELECT * FROM valuable_item_notice ORDER BY status_id FOR UPDATE SKIP LOCKED"))
+
+        if not notices:
+            return 0
+
+        statuses = list(Status.objects.filter(pk__in=[notice.status_id for notice in notices]).select_related(
+            "action_taken", "performed_by", "item__location", "item__category",
+            "item__possible_owner", "item__returned_to", "item__finder").order_by("pk"))
+
+        queue_email(*emails.valuable_digest_emails(statuses))
+        ValuableItemNotice.objects.filter(pk__in=[notice.pk for notice in notices]).delete()
+        archive_items(sorted(set(status.item_id for status in statuses if status.item.is_archived)), [])
+
+    return len(statuses)
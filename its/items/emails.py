@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.core.mail import EmailMessage
+from its.items.models import Action, Category
+
+
+def checkin_email(item):
+
+    """
+    The email to all the admins when a valuable item is checked in
+    """
+
+    subject = 'Valuable item checked in'
+    to = settings.CHECKIN_EMAIL_TO
+    from_email = settings.CHECKIN_EMAIL_FROM
+
+    ctx = {
+        'found_on': str(item.date_found),
+        'possible_owner_name': str(item.possible_owner),
+        'found_by': str(item.finder),
+        'found_in': item.location.name,
+        'category': item.category.name,
+        'description': item.description
+    }
+
+    message = render_to_string('items/checkin_email.txt', ctx)
+
+    return EmailMessage(subject, message, to=to, from_email=from_email)
+
+
+def user_checkin_email(item, possible_owner):
+
+    """
+    The email to a possible owner when an item they own is checked in
+    """
+
+    subject = 'An item belonging to you was found'
+    to = [possible_owner.email]
+    from_email = settings.CHECKIN_EMAIL_FROM
+
+    ctx = {
+        'possible_owner_name': str(item.possible_owner),
+        'found_in': item.location.name,
+    }
+
+    if item.category.machine_name == Category.USB:
+        message = render_to_string('items/user_checkin_email_usb.txt', ctx)
+
+    elif item.category.machine_name == Category.ID:
+        message = render_to_string('items/user_checkin_email_id.txt', ctx)
+
+    else:
+        message = render_to_string('items/user_checkin_email_all_other.txt', ctx)
+
+    return EmailMessage(subject, message, to=to, from_email=from_email)
+
+
+def checkout_email(item):
+
+    """
+    The email to all the admins when a valuable item is checked out
+    """
+
+    subject = 'Valuable item checked out'
+    to = settings.CHECKOUT_EMAIL_TO
+    from_email = settings.CHECKOUT_EMAIL_FROM
+
+    ctx = {
+        'found_on': str(item.date_found),
+        'possible_owner_name': str(item.possible_owner),
+        'returned_by': str(item.current_status.performed_by),
+        'returned_to': str(item.returned_to),
+        'found_in': item.location.name,
+        'category': item.category.name,
+        'description': item.description
+    }
+
+    message = render_to_string('items/checkout_email.txt', ctx)
+
+    return EmailMessage(subject, message, to=to, from_email=from_email)
+
+
+def valuable_digest_emails(statuses):
+
+    """
+    The digest emails listing valuable items checked in and returned. The
+    statuses must come with their action, performer and item rows already
+    loaded. One email goes to each distinct list of recipients.
+    """
+
+    checked_in = []
+    returned = []
+
+    for status in statuses:
+        item = status.item
+        row = {
+            'found_on': str(item.date_found),
+            'possible_owner_name': str(item.possible_owner),
+            'found_by': str(item.finder),
+            'returned_by': str(status.performed_by),
+            'returned_to': str(item.returned_to),
+            'found_in': item.location.name,
+            'category': item.category.name,
+            'description': item.description
+        }
+
+        if status.action_taken.machine_name == Action.RETURNED:
+            returned.append(row)
+
+        else:
+            checked_in.append(row)
+
+    sections = [
+        (settings.CHECKIN_EMAIL_TO, 'checked_in', checked_in),
+        (settings.CHECKOUT_EMAIL_TO, 'returned', returned),
+    ]
+
+    messages = []
+
+    for to in sorted(set(tuple(to) for to, name, rows in sections)):
+        ctx = dict((name, rows) for section_to, name, rows in sections if tuple(section_to) == to)
+
+        if not any(ctx.values()):
+            continue
+
+        subject = 'Valuable items: %d checked in, %d returned' % (len(ctx.get('checked_in', [])), len(ctx.get('returned', [])))
+        message = render_to_string('items/valuable_digest_email.txt', ctx)
+
+        messages.append(EmailMessage(subject, message, to=list(to), from_email=settings.CHECKIN_EMAIL_FROM))
+
+    return messages
@@ -1,50 +1,136 @@
+from datetime import timedelta
 from django import forms
 from django.conf import settings
+from django.db import transaction, IntegrityError
 from django.forms import ModelForm
-from its.users.models import User
-from its.items.models import Item, Location, Category, Status, Action
-from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
-from arcutils.ldap import escape, ldapsearch
-from django.db.models import Q
+from django.utils import timezone
+from its.users.models import User, DirectoryEntry, allocate_username, owner_key
+from its.items.models import Item, ArchivedItem, Location, Category, Status, Action, search_query, BULK_CHUNK_SIZE
+from its.items.models import archive_items, apply_action, reserve_ids, refresh_status_summary
+from its.items.reference import reference, ReferenceChoiceField
+from its.items import emails
+from its.items.digest import add_to_digest
+from its.jobs.outbox import queue_email
+from arcutils.ldap import escape
+from its.ldap import ldapsearch, TTLCache
+
+
+# Answers from check_ldap. A username that exists is remembered for much
+# longer than one that doesn't, since a new account may appear at any time.
+known_usernames = TTLCache(settings.USERNAME_CHECK_TTL)
+unknown_usernames = TTLCache(settings.USERNAME_CHECK_NEGATIVE_TTL)
+
+# How many generated usernames create_user tries before giving up
+USERNAME_ATTEMPTS = 10
 
 
 def check_ldap(username):
 
     """
-    Checks LDAP to ensure a user name exists.
+    Checks LDAP, or the local copy of it, to ensure a user name exists.
+    Only an exact match counts, and the search asks for at most one entry
+    and none of its attributes.
     """
 
-    q = escape(username)
-    search = '(uid={q}*)'.format(q=q)
-    results = ldapsearch(search)
+    username = username.lower()
 
-    if results:
+    if known_usernames.get(username):
         return True
 
-    else:
+    if unknown_usernames.get(username):
         return False
 
+    if settings.USE_DIRECTORY_MIRROR:
+        exists = DirectoryEntry.objects.filter(uid=username).exists()
+
+    else:
+        q = escape(username)
+        search = '(uid={q})'.format(q=q)
+        exists = bool(ldapsearch(search, attributes=['1.1'], size_limit=1))
+
+    if exists:
+        known_usernames.set(username, True)
+
+    else:
+        unknown_usernames.set(username, True)
+
+    return exists
+
 
 def create_user(new_first_name, new_last_name, new_email):
 
     """
-    Generates a unique user name.
+    Creates an inactive user with a generated unique user name. The number
+    on the end comes from a counter per name, so this takes one statement
+    however many people share the name. A name that is already taken (by a
+    user created before the counter existed, say) is skipped.
+
+    If another request records the same owner first, that user is
+    returned instead.
+    """
+
+    base = '_' + new_first_name + new_last_name
+
+    for attempt in range(USERNAME_ATTEMPTS):
+        new_user = User(first_name=new_first_name, last_name=new_last_name,
+                        email=new_email, is_active=False, is_staff=False)
+
+        # The suffix is taken outside the savepoint, so a failed save doesn't
+        # hand the same one out again on the next attempt
+        new_user.username = allocate_username(base)
+
+        try:
+            with transaction.atomic():
+                new_user.save()
+
+        except IntegrityError:
+            existing = User.objects.filter(owner_key=new_user.owner_key, is_active=False).first()
+
+            if existing is not None:
+                return existing
+
+            if attempt == USERNAME_ATTEMPTS - 1:
+                raise
+
+        else:
+            return new_user
+
+
+def get_or_create_owner(first_name, last_name, email):
+
+    """
+    The inactive user recorded for this owner, matching their email and name
+    regardless of case, created if they haven't been seen before. Finding
+    an existing owner is a single indexed query.
+    """
+
+    owner = User.objects.filter(owner_key=owner_key(first_name, last_name, email), is_active=False).first()
+
+    if owner is None:
+        owner = create_user(first_name, last_name, email)
+
+    return owner
+
+
+def get_or_create_owners(people):
+
+    """
+    get_or_create_owner() for a list of (first name, last name, email)
+    tuples. The owners that already exist are found with one query. Returns
+    a dict of the owners keyed by owner_key().
     """
 
-    new_username = '_' + new_first_name + new_last_name
-    i = 0
+    people = dict((owner_key(*person), person) for person in people)
 
-    while User.objects.filter(username=new_username + str(i)).exists():
-        i += 1
+    if not people:
+        return {}
 
-    new_username = new_username + str(i)
-    new_user = User(first_name=new_first_name, last_name=new_last_name,
-                    email=new_email, username=new_username, is_active=False, is_staff=False)
+    owners = dict((owner.owner_key, owner) for owner in User.objects.filter(owner_key__in=list(people), is_active=False))
 
-    new_user.save()
+    for key in sorted(set(people) - set(owners)):
+        owners[key] = create_user(*people[key])
 
-    return new_user
+    return owners
 
 
 class AdminActionForm(forms.Form):
@@ -53,7 +139,7 @@ class AdminActionForm(forms.Form):
     Form used on the admin-action page
     """
 
-    action_choice = forms.ModelChoiceField(queryset=Action.objects.all(), required=True, empty_label=None)
+    action_choice = ReferenceChoiceField(Action, required=True, empty_label=None)
     note = forms.CharField(widget=forms.Textarea, required=False)
     first_name = forms.CharField(required=False)
     last_name = forms.CharField(required=False)
@@ -76,25 +162,15 @@ class AdminActionForm(forms.Form):
     def checkout_email(self, item):
 
         """
-        Send an email to all the admins when a valuable item is checked out
+        Queue an email to all the admins when a valuable item is checked out,
+        or add it to the next digest
         """
-        subject = 'Valuable item checked out'
-        to = settings.CHECKOUT_EMAIL_TO
-        from_email = settings.CHECKOUT_EMAIL_FROM
-
-        ctx = {
-            'found_on': str(item.found_on()),
-            'possible_owner_name': str(item.possible_owner),
-            'returned_by': str(item.last_status().performed_by),
-            'returned_to': str(item.returned_to),
-            'found_in': item.location.name,
-            'category': item.category.name,
-            'description': item.description
-        }
 
-        message = render_to_string('items/checkout_email.txt', ctx)
+        if settings.VALUABLE_ITEM_DIGEST_WINDOW:
+            add_to_digest(item.current_status)
 
-        EmailMessage(subject, message, to=to, from_email=from_email).send()
+        else:
+            queue_email(emails.checkout_email(item))
 
     def clean(self):
 
@@ -103,7 +179,7 @@ class AdminActionForm(forms.Form):
         """
 
         cleaned_data = super().clean()
-        cleaned_data["action_choice"] = cleaned_data.get("action_choice", Action.objects.get(machine_name=Action.RETURNED))
+        cleaned_data["action_choice"] = cleaned_data.get("action_choice", reference.action(Action.RETURNED))
         note = cleaned_data.get("note")
         first_name = cleaned_data.get("first_name")
         last_name = cleaned_data.get("last_name")
@@ -131,33 +207,42 @@ class AdminActionForm(forms.Form):
         list if the item is valuable.
 
         If an item is being set to checked in set it's returned_to field to None.
+
+        An archived item is restored for the change and archived again afterwards.
         """
 
-        item = Item.objects.get(pk=item_pk)
-        action_choice = self.cleaned_data["action_choice"]
-        first_name = self.cleaned_data.get("first_name")
-        last_name = self.cleaned_data.get("last_name")
-        email = self.cleaned_data.get("email")
-        new_status = Status(item=item, action_taken=action_choice, note=self.cleaned_data['note'], performed_by=current_user).save()
+        # The email goes in the outbox in the same transaction as the new
+        # status, so it is sent if and only if the status is saved
+        with transaction.atomic():
+            archived = ArchivedItem.objects.filter(pk=item_pk).exists()
+
+            if archived:
+                archive_items([], [item_pk])
+
+            item = Item.objects.with_status_summary().get(pk=item_pk)
+            action_choice = self.cleaned_data["action_choice"]
+            first_name = self.cleaned_data.get("first_name")
+            last_name = self.cleaned_data.get("last_name")
+            email = self.cleaned_data.get("email")
+            new_status = Status(item=item, action_taken=action_choice, note=self.cleaned_data['note'], performed_by=current_user).save()
 
-        # If they chose to change status to checked in we need to make sure to
-        # set the returned_to field to None
-        if action_choice.machine_name == Action.CHECKED_IN:
-            item.returned_to = None
+            # If they chose to change status to checked in we need to make sure to
+            # set the returned_to field to None
+            if action_choice.machine_name == Action.CHECKED_IN:
+                item.returned_to = None
 
-        if action_choice.machine_name == Action.RETURNED:
+            if action_choice.machine_name == Action.RETURNED:
 
-            returned_user = User.objects.filter(first_name=first_name, last_name=last_name, email=email).first()
-            
-            if returned_user is None:
-               returned_user = create_user(first_name, last_name, email)
-            
-            item.returned_to = returned_user
+                item.returned_to = get_or_create_owner(first_name, last_name, email)
 
-            if(item.is_valuable is True):
+            item.save()
+
+            if action_choice.machine_name == Action.RETURNED and item.is_valuable is True:
                 self.checkout_email(item)
 
-        item.save()
+            if archived:
+                archive_items([item.pk], [])
+
         return item
 
 
@@ -176,14 +261,25 @@ class AdminItemFilterForm(forms.Form):
         ('possible_owner', 'Possible owner'),
     )
 
+    # order_by() fields for each sort choice. Each ends with the primary key
+    # so the ordering is total and can be paged through with a cursor.
+    sort_keys = {
+        '-pk': ('-item_id',),
+        'pk': ('item_id',),
+        'location': ('location__name', 'item_id'),
+        'category': ('category__name', 'item_id'),
+        'description': ('description', 'item_id'),
+        'possible_owner': ('possible_owner__last_name', 'possible_owner__first_name', 'item_id'),
+    }
+
     admin_item_choices = (
         ('active', 'Active'),
         ('archived', 'Archived only'),
         ('valuable', 'Valuable only'),
     )
 
-    select_location = forms.ModelChoiceField(queryset=Location.objects.all(), required=False)
-    select_category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False)
+    select_location = ReferenceChoiceField(Location, required=False)
+    select_category = ReferenceChoiceField(Category, required=False)
     sort_by = forms.ChoiceField(choices=sort_choices, required=False)
     select_items = forms.ChoiceField(choices=admin_item_choices, required=False, initial=admin_item_choices[0][0])
     keyword_or_last_name = forms.CharField(max_length=50, required=False)
@@ -194,47 +290,57 @@ class AdminItemFilterForm(forms.Form):
         Setup a filter, depending on if the user chose to filter by an active, archived, or valuable items.
         As well as by choice of location category, or keyword. The user can also select a sorting order.
         """
-        keyword_search = None
+        keywords = ''
         kwargs = {}
-
-        valid = False
+        archived = False
 
         # Setup the filter with the users selections
         if self.is_valid():
 
-            valid = True
-
+            # Only the valuable items still in the item table. Archived ones
+            # are in item_archive and are found with the archived filter.
             if self.cleaned_data['select_items'] == 'valuable':
                 kwargs['is_valuable'] = True
 
             elif self.cleaned_data['select_items'] == "archived":
-                kwargs['is_archived'] = True
+                archived = True
 
             else:
                 kwargs['is_archived'] = False
 
             if self.cleaned_data['select_location'] is not None:
-                kwargs['location'] = Location.objects.get(name=self.cleaned_data['select_location']).pk
+                kwargs['location'] = self.cleaned_data['select_location']
 
             if self.cleaned_data['select_category'] is not None:
-                kwargs['category'] = Category.objects.get(name=self.cleaned_data['select_category']).pk
+                kwargs['category'] = self.cleaned_data['select_category']
 
-            if self.cleaned_data['keyword_or_last_name'] is not '':
-                keyword_search = Q(description__icontains = self.cleaned_data['keyword_or_last_name']) | Q(possible_owner__last_name__icontains = self.cleaned_data['keyword_or_last_name'])
+            keywords = self.cleaned_data['keyword_or_last_name']
 
         else:
             kwargs['is_archived'] = False
 
-        if keyword_search:
-            item_list = Item.objects.filter(keyword_search, **kwargs).order_by('-pk')
+        # Archived items live in their own table
+        item_list = (ArchivedItem if archived else Item).objects.filter(**kwargs)
 
-        else:
-            item_list = Item.objects.filter(**kwargs).order_by('-pk')
+        if keywords:
+            item_list = item_list.search(keywords)
 
-        if valid and self.cleaned_data['sort_by'] is not '':
-            item_list = item_list.order_by(self.cleaned_data['sort_by'])
+        return item_list.order_by(*self.ordering()).with_status_summary()
 
-        return item_list
+    def ordering(self):
+
+        """
+        The order_by() fields for the sorting order the user chose. Keyword
+        searches are ordered by how well they match unless a sorting order was chosen.
+        """
+
+        if self.is_valid() and self.cleaned_data['sort_by'] is not '':
+            return self.sort_keys[self.cleaned_data['sort_by']]
+
+        if self.is_valid() and self.cleaned_data['keyword_or_last_name'] and search_query(self.cleaned_data['keyword_or_last_name']):
+            return ('-search_rank', '-item_id')
+
+        return self.sort_keys['-pk']
 
 
 class ItemFilterForm(AdminItemFilterForm):
@@ -257,54 +363,180 @@ class ItemFilterForm(AdminItemFilterForm):
         """
 
         item_list = super(ItemFilterForm, self).filter()
-        item_list = item_list.select_related("last_status").filter(laststatus__machine_name=Action.CHECKED_IN)
+        item_list = item_list.filter(laststatus__machine_name=Action.CHECKED_IN)
 
         return item_list
 
 
+class ItemIdsField(forms.Field):
+
+    """
+    A set of item ids, posted either as repeated values (one per checkbox)
+    or as a single comma separated string.
+    """
+
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return set()
+
+        if isinstance(value, str):
+            value = value.split(",")
+
+        try:
+            return set(int(pk) for pk in value if str(pk).strip())
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Enter a list of item ids.", code="invalid")
+
+
 class ItemArchiveForm(forms.Form):
 
     """
     Item archiving form used on the administrative item listing page.
+
+    The checkboxes are rendered straight from the item rows and posted as
+    archived_ids. The page's javascript lists the items whose checkbox was
+    toggled in changed_ids, so only those are touched.
     """
 
+    archived_ids = ItemIdsField(required=False)
+    # Disabled until the page's javascript enables it, so it is only posted
+    # when the javascript is there to fill it in.
+    changed_ids = ItemIdsField(required=False, widget=forms.HiddenInput(attrs={'disabled': 'disabled'}))
+
     def __init__(self, *args, item_list, **kwargs):
 
         """
-        Setup a pre-filled checkbox, based on the item's current archived status.
+        Remember the archived status of each item shown on the page.
         """
         super(ItemArchiveForm, self).__init__(*args, **kwargs)
 
         self.item_list = item_list
-        for item in item_list:
-            self.fields['archive-%d' % item.pk] = forms.BooleanField(widget=forms.CheckboxInput(attrs={'class': 'checkbox_archive'}), initial=item.is_archived, required=False)
+        self.archived = dict((item.pk, item.is_archived) for item in item_list)
+        # What save() did, as counted by archive_items()
+        self.counts = {"archived": 0, "restored": 0, "skipped": 0}
 
-    def __iter__(self):
+    def clean(self):
 
         """
-        when iterating over this form, add archive-item.pk to each item.
+        Ignore any ids that are not on the page the form was posted from.
         """
 
-        for item in self.item_list:
-            yield item, self['archive-%d' % item.pk]
+        cleaned_data = super(ItemArchiveForm, self).clean()
+        visible_ids = set(self.archived)
+
+        cleaned_data["archived_ids"] = cleaned_data.get("archived_ids", set()) & visible_ids
+
+        # Without javascript every item on the page could have changed.
+        if "changed_ids" in self.data:
+            cleaned_data["changed_ids"] = cleaned_data.get("changed_ids", set()) & visible_ids
+        else:
+            cleaned_data["changed_ids"] = visible_ids
+
+        return cleaned_data
 
     def save(self):
 
         """
-        If an item is in the list, swap the items archived status.
+        Swap the archived status of the items whose checkbox changed. The
+        items to archive and to unarchive are each updated with a single
+        statement. Returns whether anything changed, and keeps the counts from
+        archive_items() in self.counts.
+        """
+
+        archived_ids = self.cleaned_data["archived_ids"]
+        changed_ids = self.cleaned_data["changed_ids"]
+        currently_archived = set(pk for pk, is_archived in self.archived.items() if is_archived)
+
+        archive_ids = (archived_ids - currently_archived) & changed_ids
+        unarchive_ids = (changed_ids - archived_ids) & currently_archived
+
+        self.counts = archive_items(sorted(archive_ids), sorted(unarchive_ids))
+
+        return bool(self.counts["archived"] or self.counts["restored"])
+
+
+class BulkActionForm(forms.Form):
+
+    """
+    Form used on the administrative item listing page to take an action on
+    many items at once: the items ticked on the page, or every item that
+    matches the filter.
+    """
+
+    action_choice = ReferenceChoiceField(Action, required=True, empty_label=None)
+    note = forms.CharField(required=False)
+    selected_ids = ItemIdsField(required=False)
+    apply_to_all = forms.BooleanField(required=False, label="Every item matching the filter")
+
+    def __init__(self, *args, item_list, **kwargs):
+        super(BulkActionForm, self).__init__(*args, **kwargs)
+
+        self.item_list = item_list
+
+    def clean(self):
+
+        """
+        Returning an item needs the person it went to, so that can only be
+        done one item at a time. Archived items can't be changed.
+        """
+
+        cleaned_data = super(BulkActionForm, self).clean()
+        action_choice = cleaned_data.get("action_choice")
+
+        if action_choice is not None and action_choice.machine_name == Action.RETURNED:
+            self.add_error("action_choice", "Items can only be returned one at a time, from their action page.")
+
+        if self.item_list.model is not Item:
+            raise forms.ValidationError("Archived items have to be unarchived before an action can be taken on them.")
+
+        if not cleaned_data.get("apply_to_all") and not cleaned_data.get("selected_ids"):
+            raise forms.ValidationError("Select the items to take the action on.")
+
+        return cleaned_data
+
+    def save(self, *args, current_user, **kwargs):
+
+        """
+        Take the action on the chosen items. Ids that don't match the filter
+        are ignored. Returns the number of items changed.
         """
 
-        changed = False
+        item_list = self.item_list
+
+        if not self.cleaned_data["apply_to_all"]:
+            item_list = item_list.filter(pk__in=self.cleaned_data["selected_ids"])
+
+        item_ids = list(item_list.order_by("pk").values_list("pk", flat=True))
+        apply_action(item_ids, self.cleaned_data["action_choice"], self.cleaned_data["note"], current_user)
+
+        return len(item_ids)
+
+
+class ReportForm(forms.Form):
+
+    """
+    The period shown on the reports page. It defaults to the last year.
+    """
+
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def period(self):
 
-        for item in self.item_list:
-            is_archived = self.cleaned_data.get("archive-%d" % item.pk)
+        """
+        The first and last days to report on.
+        """
+
+        end = timezone.localtime(timezone.now()).date()
+        start = end - timedelta(days=365)
 
-            if item.is_archived is not is_archived:
-                item.is_archived = is_archived
-                item.save()
-                changed = True
+        if self.is_valid():
+            end = self.cleaned_data['end'] or end
+            start = self.cleaned_data['start'] or start
 
-        return changed
+        return start, end
 
 
 class CheckInForm(ModelForm):
@@ -313,6 +545,8 @@ class CheckInForm(ModelForm):
     Form for the checkin view
     """
 
+    location = ReferenceChoiceField(Location)
+    category = ReferenceChoiceField(Category)
     possible_owner_found = forms.BooleanField(required=False)
     username = forms.CharField(required=False)
     first_name = forms.CharField(required=False)
@@ -322,50 +556,23 @@ class CheckInForm(ModelForm):
     def checkin_email(self, item):
 
         """
-        Send an email to all the admins when a valuable item is checked in
+        Queue an email to all the admins when a valuable item is checked in,
+        or add it to the next digest
         """
-        subject = 'Valuable item checked in'
-        to = settings.CHECKIN_EMAIL_TO
-        from_email = settings.CHECKIN_EMAIL_FROM
-
-        ctx = {
-            'found_on': str(item.found_on()),
-            'possible_owner_name': str(item.possible_owner),
-            'found_by': str(item.found_by()),
-            'found_in': item.location.name,
-            'category': item.category.name,
-            'description': item.description
-        }
 
-        message = render_to_string('items/checkin_email.txt', ctx)
+        if settings.VALUABLE_ITEM_DIGEST_WINDOW:
+            add_to_digest(item.current_status)
 
-        EmailMessage(subject, message, to=to, from_email=from_email).send()
+        else:
+            queue_email(emails.checkin_email(item))
 
     def user_checkin_email(self, item, possible_owner):
 
         """
-        Send an email to a possible owner when an item they own is checked in
+        Queue an email to a possible owner when an item they own is checked in
         """
 
-        subject = 'An item belonging to you was found'
-        to = [possible_owner.email]
-        from_email = settings.CHECKIN_EMAIL_FROM
-
-        ctx = {
-            'possible_owner_name': str(item.possible_owner),
-            'found_in': item.location.name,
-        }
-
-        if item.category.machine_name == Category.USB:
-            message = render_to_string('items/user_checkin_email_usb.txt', ctx)
-
-        elif item.category.machine_name == Category.ID:
-            message = render_to_string('items/user_checkin_email_id.txt', ctx)
-
-        else:
-            message = render_to_string('items/user_checkin_email_all_other.txt', ctx)
-
-        EmailMessage(subject, message, to=to, from_email=from_email).send()
+        queue_email(emails.user_checkin_email(item, possible_owner))
 
     def clean(self):
 
@@ -374,28 +581,7 @@ class CheckInForm(ModelForm):
         to provide a first name, last name, and email.
         """
 
-        cleaned_data = super(CheckInForm, self).clean()
-        username = cleaned_data.get("username")
-        first_name = cleaned_data.get("first_name")
-        last_name = cleaned_data.get("last_name")
-        email = cleaned_data.get("email")
-        possible_owner_found = cleaned_data.get("possible_owner_found")
-
-        # If possilbe owner found is checked we need to make these
-        # optional fields required.
-        if possible_owner_found and not first_name:
-            self.add_error("first_name", "First name required")
-
-        if possible_owner_found and not last_name:
-            self.add_error("last_name", "Last name required")
-
-        if possible_owner_found and not email:
-            self.add_error("email", "Email required")
-
-        if possible_owner_found and username and not check_ldap(username):
-            self.add_error("username", "Invalid username, enter a valid username or leave blank.")
-
-        return cleaned_data
+        return check_possible_owner(self, super(CheckInForm, self).clean())
 
     def save(self, *args, current_user, **kwargs):
 
@@ -407,30 +593,128 @@ class CheckInForm(ModelForm):
         user_last_name = self.cleaned_data['last_name']
         user_email = self.cleaned_data['email']
 
-        # If an owner was found we need to record them as an owner
-        # This may require that a new user is created
-        if self.cleaned_data.get("possible_owner_found") is True:
-
-            checkin_user = User.objects.filter(first_name=user_first_name, last_name=user_last_name, email=user_email).first()
-            
-            if checkin_user is None:
-                checkin_user = create_user(user_first_name, user_last_name, user_email)
+        with transaction.atomic():
+            # If an owner was found we need to record them as an owner
+            # This may require that a new user is created
+            if self.cleaned_data.get("possible_owner_found") is True:
+                checkin_user = get_or_create_owner(user_first_name, user_last_name, user_email)
+                self.instance.possible_owner = checkin_user
 
-            self.instance.possible_owner = checkin_user
+            item = super(CheckInForm, self).save(*args, **kwargs)
 
-        item = super(CheckInForm, self).save(*args, **kwargs)
+            new_action = reference.action(Action.CHECKED_IN)
+            new_status = Status(item=item, action_taken=new_action, note="Initial check-in", performed_by=current_user).save()
 
-        new_action = Action.objects.get(machine_name=Action.CHECKED_IN)
-        new_status = Status(item=item, action_taken=new_action, note="Initial check-in", performed_by=current_user).save()
+            if(self.cleaned_data['email'] != ''):
+                self.user_checkin_email(item, checkin_user)
 
-        if(self.cleaned_data['email'] != ''):
-            self.user_checkin_email(item, checkin_user)
-
-        if(self.cleaned_data['is_valuable'] is True):
-            self.checkin_email(item)
+            if(self.cleaned_data['is_valuable'] is True):
+                self.checkin_email(item)
 
         return item
 
     class Meta:
         model = Item
         fields = ['location', 'category', 'description', 'is_valuable']
+
+
+def check_possible_owner(form, cleaned_data):
+
+    """
+    If possible owner found is checked on a check in form, we need to make
+    the optional owner fields required.
+    """
+
+    username = cleaned_data.get("username")
+    possible_owner_found = cleaned_data.get("possible_owner_found")
+
+    if possible_owner_found and not cleaned_data.get("first_name"):
+        form.add_error("first_name", "First name required")
+
+    if possible_owner_found and not cleaned_data.get("last_name"):
+        form.add_error("last_name", "Last name required")
+
+    if possible_owner_found and not cleaned_data.get("email"):
+        form.add_error("email", "Email required")
+
+    if possible_owner_found and username and not check_ldap(username):
+        form.add_error("username", "Invalid username, enter a valid username or leave blank.")
+
+    return cleaned_data
+
+
+class CheckInItemForm(forms.Form):
+
+    """
+    One item sent to the bulk check in API. It has the same fields and
+    checks as CheckInForm, but is a plain form so that validating it
+    doesn't query the database.
+    """
+
+    location = ReferenceChoiceField(Location)
+    category = ReferenceChoiceField(Category)
+    description = forms.CharField()
+    is_valuable = forms.BooleanField(required=False)
+    possible_owner_found = forms.BooleanField(required=False)
+    username = forms.CharField(required=False)
+    first_name = forms.CharField(required=False)
+    last_name = forms.CharField(required=False)
+    email = forms.EmailField(required=False)
+
+    def clean(self):
+        return check_possible_owner(self, super(CheckInItemForm, self).clean())
+
+
+def check_in_items(entries, current_user):
+
+    """
+    Check in a list of items from the cleaned data of CheckInItemForms, in
+    a single transaction. The items and their statuses are each written
+    with one bulk insert, their possible owners are looked up together,
+    and the emails a check in sends are queued in one go. Returns the
+    new items.
+    """
+
+    checked_in = reference.action(Action.CHECKED_IN)
+    people = [(entry['first_name'], entry['last_name'], entry['email']) for entry in entries if entry.get('possible_owner_found')]
+
+    with transaction.atomic():
+        owners = get_or_create_owners(people)
+        items = []
+        statuses = []
+
+        for item_id, status_id, entry in zip(reserve_ids(Item, len(entries)), reserve_ids(Status, len(entries)), entries):
+            owner = None
+
+            if entry.get('possible_owner_found'):
+                owner = owners[owner_key(entry['first_name'], entry['last_name'], entry['email'])]
+
+            item = Item(item_id=item_id, location=entry['location'], category=entry['category'],
+                        description=entry['description'], is_valuable=entry['is_valuable'], possible_owner=owner)
+            items.append(item)
+            statuses.append(Status(status_id=status_id, item=item, action_taken=checked_in,
+                                   note="Initial check-in", performed_by=current_user))
+
+        Item.objects.bulk_create(items, batch_size=BULK_CHUNK_SIZE)
+        Status.objects.bulk_create(statuses, batch_size=BULK_CHUNK_SIZE)
+        refresh_status_summary(item.pk for item in items)
+
+        # Match what refresh_status_summary() wrote, for the emails
+        for item, status in zip(items, statuses):
+            item.current_status = status
+            item.date_found = status.timestamp
+            item.finder = current_user
+
+        messages = [emails.user_checkin_email(item, item.possible_owner) for item in items if item.possible_owner is not None]
+        valuable = [item for item in items if item.is_valuable]
+
+        if settings.VALUABLE_ITEM_DIGEST_WINDOW:
+            add_to_digest(*[item.current_status for item in valuable])
+
+        else:
+            messages.extend(emails.checkin_email(item) for item in valuable)
+
+        if messages:
+            queue_email(*messages)
+
+    return items
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from its.items.models import Item, Action, Category, apply_action, archive_items, BULK_CHUNK_SIZE
+from its.items.reference import reference
+
+
+def describe(policy):
+    category = policy['category'] or 'Every category'
+    action = policy['action'] or 'ARCHIVED'
+
+    return '%s after %d days becomes %s' % (category, policy['days'], action)
+
+
+class Command(BaseCommand):
+    help = 'Moves on the items that have been kept too long, following settings.RETENTION_POLICIES.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Report how many items each policy would change, without changing them.'),
+        make_option('--chunk-size', type='int', default=BULK_CHUNK_SIZE,
+                    help='Number of items changed in each transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        for policy in settings.RETENTION_POLICIES:
+            items = self.candidates(policy, now)
+
+            if options['dry_run']:
+                self.stdout.write('%s: %d items would change' % (describe(policy), items.count()))
+                continue
+
+            action = reference.action(policy['action']) if policy['action'] else None
+            count = skipped = 0
+
+            for chunk in self.chunks(items, options['chunk_size']):
+                if action is None:
+                    counts = archive_items(chunk, [])
+                    count += counts['archived']
+                    skipped += counts['skipped']
+
+                else:
+                    apply_action(chunk, action, 'Retention policy: %s' % describe(policy), None)
+                    count += len(chunk)
+
+            self.stdout.write('%s: %d items changed' % (describe(policy), count))
+
+            if skipped:
+                self.stdout.write('%s: %d items will be archived once the valuable item digest has gone out' % (describe(policy), skipped))
+
+    def candidates(self, policy, now):
+
+        """
+        The unarchived items a policy applies to. The found date and category
+        are answered by the item_retention indexes, and the current action by
+        the last_status table.
+        """
+
+        items = Item.objects.filter(is_archived=False, date_found__lt=now - timedelta(days=policy['days']))
+
+        if policy['category']:
+            category = reference.get(Category, machine_name=policy['category'])
+
+            if category is None:
+                raise CommandError('There is no %s category.' % policy['category'])
+
+            items = items.filter(category=category)
+
+        if policy['action']:
+            if reference.action(policy['action']) is None:
+                raise CommandError('There is no %s action.' % policy['action'])
+
+            items = items.filter(laststatus__machine_name=Action.CHECKED_IN)
+
+        return items
+
+    def chunks(self, items, size):
+
+        """
+        The ids of items, size at a time in the order they were found. Each
+        chunk is read with one query that carries on from the last item of
+        the one before, so the items are never all loaded at once.
+        """
+
+        last = None
+
+        while True:
+            page = items
+
+            if last is not None:
+                page = page.extra(where=['(item.date_found, item.item_id) > (%s, %s)'], params=list(last))
+
+            rows = list(page.order_by('date_found', 'pk').values_list('date_found', 'pk')[:size])
+
+            if not rows:
+                return
+
+            yield [pk for date_found, pk in rows]
+            last = rows[-1]
@@ -0,0 +1,150 @@
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from its.items.forms import AdminItemFilterForm, ItemFilterForm
+from its.items.models import refresh_status_summary, archive_items
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Checks that the item list queries use index scans, optionally on a temporarily seeded database.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--seed', type='int', default=100000,
+                    help='Number of items to add before checking. They are rolled back afterwards. Use 0 to check the existing data.'),
+        make_option('--show-plans', action='store_true', default=False,
+                    help='Print the query plan for every query.'),
+    )
+
+    # Tables that must never be read with a sequential scan. The reference
+    # tables are small enough that a sequential scan is the right plan.
+    large_tables = ('item', 'status', 'last_status', 'item_archive', 'status_archive', 'user')
+
+    def handle(self, *args, **options):
+        failures = []
+
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+
+                for name, queryset in self.list_queries():
+                    plan = self.explain(queryset[:settings.ITEM_LIST_PAGE_SIZE + 1])
+                    scanned = [table for table in self.large_tables if 'Seq Scan on %s ' % table in plan or 'Seq Scan on "%s"' % table in plan]
+
+                    if scanned:
+                        failures.append(name)
+                        self.stdout.write('FAIL %s: sequential scan on %s' % (name, ', '.join(scanned)))
+
+                    else:
+                        self.stdout.write('OK   %s' % name)
+
+                    if scanned or options['show_plans']:
+                        self.stdout.write(plan + '\n')
+
+                # Never keep the seeded rows
+                raise Rollback()
+
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError('%d of the list queries do not use index scans.' % len(failures))
+
+    def list_queries(self):
+
+        """
+        The querysets behind the admin and lab attendant item lists, for each
+        filter and sorting order.
+        """
+
+        location_id, category_id = self.reference_ids()
+
+        filters = [
+            ('active', {}),
+            ('archived', {'select_items': 'archived'}),
+            ('valuable', {'select_items': 'valuable'}),
+            ('location', {'select_location': location_id}),
+            ('category', {'select_category': category_id}),
+            ('keyword', {'keyword_or_last_name': 'blue flask'}),
+        ]
+
+        for sort_by, label in AdminItemFilterForm.sort_choices:
+            filters.append(('sorted by %s' % label.lower(), {'sort_by': sort_by}))
+
+        for name, data in filters:
+            data = dict({'select_items': 'active', 'sort_by': ''}, **data)
+            yield 'admin list, %s' % name, AdminItemFilterForm(data).filter()
+
+            if data['select_items'] != 'archived':
+                yield 'item list, %s' % name, ItemFilterForm(data).filter()
+
+    def reference_ids(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT min(location_id) FROM location")
+            location_id = cursor.fetchone()[0]
+            cursor.execute("SELECT min(category_id) FROM category")
+            category_id = cursor.fetchone()[0]
+
+        return location_id, category_id
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def seed(self, count):
+
+        """
+        Add count items, nine in ten of them archived, each with a check in
+        status and a later status for most of the archived ones.
+        """
+
+        self.stdout.write('Seeding %d items...' % count)
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO location (name) SELECT 'Seed location ' || i FROM generate_series(1, 20) i;
+                INSERT INTO category (name) SELECT 'Seed category ' || i FROM generate_series(1, 20) i;
+                INSERT INTO action (name, machine_name, weight) VALUES ('Seed action', 'SEED', 0);
+
+                INSERT INTO item (location_id, category_id, description, is_valuable, is_archived)
+                SELECT
+                    (SELECT min(location_id) FROM location WHERE name LIKE 'Seed location %%') + i %% 20,
+                    (SELECT min(category_id) FROM category WHERE name LIKE 'Seed category %%') + i %% 20,
+                    'Seed item ' || md5(i::text),
+                    i %% 13 = 0,
+                    i %% 10 <> 0
+                FROM generate_series(1, %s) i;
+
+                INSERT INTO status (item_id, action_taken_id, timestamp, note)
+                SELECT item_id, COALESCE((SELECT action_id FROM action WHERE machine_name = 'CHECKED_IN'),
+                                         (SELECT action_id FROM action WHERE machine_name = 'SEED')), now(), ''
+                FROM item WHERE description LIKE 'Seed item %%';
+
+                INSERT INTO status (item_id, action_taken_id, timestamp, note)
+                SELECT item_id, (SELECT action_id FROM action WHERE machine_name = 'SEED'), now(), ''
+                FROM item WHERE description LIKE 'Seed item %%' AND is_archived;
+            """, [count])
+
+            cursor.execute("SELECT item_id FROM item WHERE description LIKE 'Seed item %%'")
+            item_ids = [row[0] for row in cursor.fetchall()]
+
+        refresh_status_summary(item_ids)
+
+        # Archived items belong in the archive tables
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT item_id FROM item WHERE description LIKE 'Seed item %%' AND is_archived")
+            archive_items([row[0] for row in cursor.fetchall()], [])
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                ANALYZE item; ANALYZE status; ANALYZE last_status; ANALYZE item_archive; ANALYZE status_archive;
+                ANALYZE location; ANALYZE category;
+            """)
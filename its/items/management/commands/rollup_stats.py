@@ -0,0 +1,21 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from its.items.reports import rollup_daily_stats, rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Adds the statuses written since the last run to the daily_item_stats table behind the reports page. Run it nightly.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rebuild', action='store_true', default=False,
+                    help='Empty the table and count every status again.'),
+    )
+
+    def handle(self, *args, **options):
+        counted = rebuild_daily_stats() if options['rebuild'] else rollup_daily_stats()
+
+        if counted is None:
+            self.stdout.write('No new statuses')
+
+        else:
+            self.stdout.write('Counted statuses %d to %d' % counted)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20150226_1314'),
+        ('items', '0017_add_last_status_view'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='current_status',
+            field=models.ForeignKey(related_name='+', null=True, on_delete=django.db.models.deletion.SET_NULL, to='items.Status'),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='date_found',
+            field=models.DateTimeField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='finder',
+            field=models.ForeignKey(related_name='item_finder', null=True, on_delete=django.db.models.deletion.SET_NULL, to='users.User'),
+            preserve_default=True,
+        ),
+    ]
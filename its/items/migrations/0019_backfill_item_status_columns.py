@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0018_item_status_columns'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+UPDATE item SET
+    current_status_id = summary.last_status_id,
+    date_found = first_status.timestamp,
+    finder_id = first_status.performed_by_id
+FROM (
+    SELECT item_id, MAX(status_id) AS last_status_id, MIN(status_id) AS first_status_id
+    FROM status
+    GROUP BY item_id
+) summary
+INNER JOIN status first_status ON first_status.status_id = summary.first_status_id
+WHERE item.item_id = summary.item_id;
+""", reverse_sql="""
+UPDATE item SET current_status_id = NULL, date_found = NULL, finder_id = NULL;
+""")
+    ]
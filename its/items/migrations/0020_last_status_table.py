@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0019_backfill_item_status_columns'),
+    ]
+
+    operations = [
+        migrations.RunSQL("DROP VIEW IF EXISTS last_status;", reverse_sql="""
+CREATE OR REPLACE VIEW last_status AS
+ SELECT status.status_id,
+    item.item_id,
+    action.machine_name
+   FROM item
+     JOIN status USING (item_id)
+     JOIN ( SELECT max(status_1.status_id) AS status_id
+           FROM status status_1
+          GROUP BY status_1.item_id) k USING (status_id)
+     JOIN action ON status.action_taken_id = action.action_id;
+"""),
+        migrations.DeleteModel(
+            name='LastStatus',
+        ),
+        migrations.CreateModel(
+            name='LastStatus',
+            fields=[
+                ('item', models.OneToOneField(primary_key=True, serialize=False, to='items.Item')),
+                ('machine_name', models.CharField(max_length=50)),
+                ('status', models.ForeignKey(related_name='+', to='items.Status')),
+            ],
+            options={
+                'db_table': 'last_status',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='laststatus',
+            index_together=set([('machine_name', 'item')]),
+        ),
+        migrations.RunSQL("""
+INSERT INTO last_status (item_id, status_id, machine_name)
+SELECT item.item_id, status.status_id, action.machine_name
+FROM item
+INNER JOIN status ON status.status_id = item.current_status_id
+INNER JOIN action ON action.action_id = status.action_taken_id;
+""", reverse_sql="DELETE FROM last_status;"),
+    ]
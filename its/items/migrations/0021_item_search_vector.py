@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# The search_vector column isn't on the Item model. It is filled in by the
+# triggers below whenever an item, or a category, location or possible owner
+# it points at, changes.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0020_last_status_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+ALTER TABLE item ADD COLUMN search_vector tsvector;
+
+CREATE FUNCTION item_search_vector(description text, category_id integer, location_id integer, possible_owner_id integer)
+RETURNS tsvector LANGUAGE sql STABLE AS $$
+    SELECT
+        setweight(to_tsvector('simple', coalesce($1, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce((SELECT first_name || ' ' || last_name || ' ' || email || ' ' || replace(email, '@', ' ')
+                                                   FROM "user" WHERE user_id = $4), '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce((SELECT name FROM category WHERE category.category_id = $2), '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((SELECT name FROM location WHERE location.location_id = $3), '')), 'B')
+$$;
+
+CREATE FUNCTION item_search_vector_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := item_search_vector(NEW.description, NEW.category_id, NEW.location_id, NEW.possible_owner_id);
+    RETURN NEW;
+END
+$$;
+
+CREATE FUNCTION item_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'category' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE category_id = NEW.category_id;
+    ELSIF TG_TABLE_NAME = 'location' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE location_id = NEW.location_id;
+    ELSE
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE possible_owner_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER item_search_vector BEFORE INSERT OR UPDATE OF description, category_id, location_id, possible_owner_id
+ON item FOR EACH ROW EXECUTE PROCEDURE item_search_vector_update();
+
+CREATE TRIGGER item_search_vector_category AFTER UPDATE OF name ON category
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE PROCEDURE item_search_vector_refresh();
+
+CREATE TRIGGER item_search_vector_location AFTER UPDATE OF name ON location
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE PROCEDURE item_search_vector_refresh();
+
+CREATE TRIGGER item_search_vector_user AFTER UPDATE OF first_name, last_name, email ON "user"
+FOR EACH ROW WHEN ((OLD.first_name, OLD.last_name, OLD.email) IS DISTINCT FROM (NEW.first_name, NEW.last_name, NEW.email))
+EXECUTE PROCEDURE item_search_vector_refresh();
+
+UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id);
+
+CREATE INDEX item_search_vector_idx ON item USING gin (search_vector);
+""", reverse_sql="""
+DROP TRIGGER item_search_vector_user ON "user";
+DROP TRIGGER item_search_vector_location ON location;
+DROP TRIGGER item_search_vector_category ON category;
+DROP TRIGGER item_search_vector ON item;
+DROP FUNCTION item_search_vector_refresh();
+DROP FUNCTION item_search_vector_update();
+DROP FUNCTION item_search_vector(text, integer, integer, integer);
+ALTER TABLE item DROP COLUMN search_vector;
+""")
+    ]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Adds a lower cased search_text column holding the description and possible
+# owner's name, with a trigram index for the item type-ahead. It is kept up to
+# date by the same triggers as search_vector.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0021_item_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE item ADD COLUMN search_text text;
+
+CREATE FUNCTION item_search_text(description text, possible_owner_id integer)
+RETURNS text LANGUAGE sql STABLE AS $$
+    SELECT lower(coalesce($1, '') || ' ' || coalesce((SELECT first_name || ' ' || last_name FROM "user" WHERE user_id = $2), ''))
+$$;
+
+CREATE OR REPLACE FUNCTION item_search_vector_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := item_search_vector(NEW.description, NEW.category_id, NEW.location_id, NEW.possible_owner_id);
+    NEW.search_text := item_search_text(NEW.description, NEW.possible_owner_id);
+    RETURN NEW;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION item_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'category' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE category_id = NEW.category_id;
+    ELSIF TG_TABLE_NAME = 'location' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE location_id = NEW.location_id;
+    ELSE
+        UPDATE item SET
+            search_vector = item_search_vector(description, category_id, location_id, possible_owner_id),
+            search_text = item_search_text(description, possible_owner_id)
+        WHERE possible_owner_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+UPDATE item SET search_text = item_search_text(description, possible_owner_id);
+
+CREATE INDEX item_search_text_trgm_idx ON item USING gin (search_text gin_trgm_ops) WHERE NOT is_archived;
+""", reverse_sql="""
+DROP INDEX item_search_text_trgm_idx;
+
+CREATE OR REPLACE FUNCTION item_search_vector_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := item_search_vector(NEW.description, NEW.category_id, NEW.location_id, NEW.possible_owner_id);
+    RETURN NEW;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION item_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'category' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE category_id = NEW.category_id;
+    ELSIF TG_TABLE_NAME = 'location' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE location_id = NEW.location_id;
+    ELSE
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE possible_owner_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DROP FUNCTION item_search_text(text, integer);
+ALTER TABLE item DROP COLUMN search_text;
+""")
+    ]
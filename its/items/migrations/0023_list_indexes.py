@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Indexes for the item list filters and sorting orders. Active items are a
+# small part of the table, so most of these only cover them.
+# Run `./manage.py checkplans` to check the list queries use them.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20150226_1314'),
+        ('items', '0022_item_search_text'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+CREATE INDEX item_active_idx ON item (item_id DESC) WHERE NOT is_archived;
+CREATE INDEX item_active_location_idx ON item (location_id, item_id DESC) WHERE NOT is_archived;
+CREATE INDEX item_active_category_idx ON item (category_id, item_id DESC) WHERE NOT is_archived;
+CREATE INDEX item_archived_idx ON item (item_id DESC) WHERE is_archived;
+CREATE INDEX item_valuable_idx ON item (item_id DESC) WHERE is_valuable;
+CREATE INDEX item_possible_owner_active_idx ON item (possible_owner_id, item_id) WHERE NOT is_archived;
+CREATE INDEX status_item_status_idx ON status (item_id, status_id DESC);
+CREATE INDEX user_name_idx ON "user" (last_name, first_name, user_id);
+CREATE INDEX location_name_idx ON location (name, location_id);
+CREATE INDEX category_name_idx ON category (name, category_id);
+""", reverse_sql="""
+DROP INDEX category_name_idx;
+DROP INDEX location_name_idx;
+DROP INDEX user_name_idx;
+DROP INDEX status_item_status_idx;
+DROP INDEX item_possible_owner_active_idx;
+DROP INDEX item_valuable_idx;
+DROP INDEX item_archived_idx;
+DROP INDEX item_active_category_idx;
+DROP INDEX item_active_location_idx;
+DROP INDEX item_active_idx;
+""")
+    ]
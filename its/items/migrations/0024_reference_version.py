@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# A single row version stamp for the action, category and location tables.
+# Any change to them sets it to the id of the changing transaction, which
+# tells every process that its cached copy (its/items/reference.py) is stale.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0023_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+CREATE TABLE reference_version (version bigint NOT NULL);
+INSERT INTO reference_version (version) VALUES (txid_current());
+
+CREATE FUNCTION reference_version_bump() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE reference_version SET version = txid_current();
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER action_reference_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON action
+FOR EACH STATEMENT EXECUTE PROCEDURE reference_version_bump();
+
+CREATE TRIGGER category_reference_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON category
+FOR EACH STATEMENT EXECUTE PROCEDURE reference_version_bump();
+
+CREATE TRIGGER location_reference_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON location
+FOR EACH STATEMENT EXECUTE PROCEDURE reference_version_bump();
+""", reverse_sql="""
+DROP TRIGGER location_reference_version ON location;
+DROP TRIGGER category_reference_version ON category;
+DROP TRIGGER action_reference_version ON action;
+DROP FUNCTION reference_version_bump();
+DROP TABLE reference_version;
+""")
+    ]
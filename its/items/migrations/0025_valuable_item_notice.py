@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0024_reference_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValuableItemNotice',
+            fields=[
+                ('notice_id', models.AutoField(primary_key=True, serialize=False)),
+                ('status', models.OneToOneField(related_name='+', to='items.Status')),
+            ],
+            options={
+                'db_table': 'valuable_item_notice',
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Indexes for manage.py apply_retention, which looks for the active items
+# found before a cut off date, in one category or all of them.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0025_valuable_item_notice'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+CREATE INDEX item_retention_idx ON item (date_found, item_id) WHERE NOT is_archived;
+CREATE INDEX item_retention_category_idx ON item (category_id, date_found, item_id) WHERE NOT is_archived;
+""", reverse_sql="""
+DROP INDEX item_retention_category_idx;
+DROP INDEX item_retention_idx;
+""")
+    ]
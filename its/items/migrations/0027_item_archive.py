@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+# Archived items and their statuses move to item_archive and status_archive,
+# which the active item lists never read. The move_items_to_archive() and
+# restore_items_from_archive() functions do the moves (see archive_items()),
+# and have to list any column added to these tables. Items already marked
+# archived are moved when this runs.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_owner_key'),
+        ('items', '0026_retention_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedItem',
+            fields=[
+                ('item_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('location', models.ForeignKey(to='items.Location')),
+                ('category', models.ForeignKey(to='items.Category')),
+                ('description', models.TextField()),
+                ('is_valuable', models.BooleanField(default=False)),
+                ('possible_owner', models.ForeignKey(related_name='archived_item_possible_owner', null=True, to='users.User')),
+                ('returned_to', models.ForeignKey(related_name='archived_item_returned_to', null=True, to='users.User')),
+                ('date_found', models.DateTimeField(null=True)),
+                ('finder', models.ForeignKey(related_name='archived_item_finder', null=True, on_delete=django.db.models.deletion.SET_NULL, to='users.User')),
+                ('archived_on', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'item_archive',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ArchivedStatus',
+            fields=[
+                ('status_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('item', models.ForeignKey(to='items.ArchivedItem')),
+                ('action_taken', models.ForeignKey(to='items.Action')),
+                ('performed_by', models.ForeignKey(null=True, default=None, to='users.User')),
+                ('timestamp', models.DateTimeField()),
+                ('note', models.TextField()),
+            ],
+            options={
+                'db_table': 'status_archive',
+                'ordering': ['-pk'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='archiveditem',
+            name='current_status',
+            field=models.ForeignKey(related_name='+', null=True, on_delete=django.db.models.deletion.SET_NULL, to='items.ArchivedStatus'),
+            preserve_default=True,
+        ),
+        migrations.RunSQL("""
+ALTER TABLE item_archive ADD COLUMN search_vector tsvector, ADD COLUMN search_text text;
+CREATE INDEX item_archive_search_vector_idx ON item_archive USING gin (search_vector);
+CREATE INDEX status_archive_item_status_idx ON status_archive (item_id, status_id DESC);
+
+-- Both functions return how many of the items were moved, and how many
+-- were skipped because they weren't there to move or had to stay
+CREATE FUNCTION move_items_to_archive(ids integer[], OUT moved integer, OUT skipped integer) LANGUAGE plpgsql AS $$
+DECLARE
+    moved_ids integer[];
+BEGIN
+    -- Items with a status waiting for the valuable item digest stay until it has gone out
+    SELECT array_agg(item_id) INTO moved_ids FROM (
+        SELECT item_id FROM item
+        WHERE item_id = ANY(ids) AND NOT EXISTS (
+            SELECT 1 FROM valuable_item_notice
+            INNER JOIN status ON status.status_id = valuable_item_notice.status_id
+            WHERE status.item_id = item.item_id
+        )
+        ORDER BY item_id
+        FOR UPDATE
+    ) AS locked;
+
+    moved := coalesce(array_length(moved_ids, 1), 0);
+    skipped := (SELECT count(DISTINCT id) FROM unnest(ids) AS id) - moved;
+
+    -- The ones that stay are marked, and send_valuable_digest() moves them
+    -- once their digest has gone out
+    UPDATE item SET is_archived = true
+    WHERE item_id = ANY(ids) AND item_id <> ALL(coalesce(moved_ids, '{}'));
+
+    IF moved = 0 THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO item_archive (item_id, location_id, category_id, description, is_valuable, possible_owner_id, returned_to_id,
+                              current_status_id, date_found, finder_id, search_vector, search_text, archived_on)
+    SELECT item_id, location_id, category_id, description, is_valuable, possible_owner_id, returned_to_id,
+           current_status_id, date_found, finder_id, search_vector, search_text, now()
+    FROM item WHERE item_id = ANY(moved_ids);
+
+    INSERT INTO status_archive (status_id, item_id, action_taken_id, performed_by_id, timestamp, note)
+    SELECT status_id, item_id, action_taken_id, performed_by_id, timestamp, note
+    FROM status WHERE item_id = ANY(moved_ids);
+
+    -- The foreign keys between item and status are only checked at commit
+    DELETE FROM last_status WHERE item_id = ANY(moved_ids);
+    DELETE FROM status WHERE item_id = ANY(moved_ids);
+    DELETE FROM item WHERE item_id = ANY(moved_ids);
+END
+$$;
+
+CREATE FUNCTION restore_items_from_archive(ids integer[], OUT moved integer, OUT skipped integer) LANGUAGE plpgsql AS $$
+DECLARE
+    restored integer[];
+BEGIN
+    SELECT array_agg(item_id) INTO restored FROM (
+        SELECT item_id FROM item_archive WHERE item_id = ANY(ids) ORDER BY item_id FOR UPDATE
+    ) AS locked;
+
+    moved := coalesce(array_length(restored, 1), 0);
+    skipped := (SELECT count(DISTINCT id) FROM unnest(ids) AS id) - moved;
+
+    IF moved = 0 THEN
+        RETURN;
+    END IF;
+
+    -- The search columns are filled in again by the item_search_vector trigger
+    INSERT INTO item (item_id, location_id, category_id, description, is_valuable, possible_owner_id, returned_to_id,
+                      is_archived, current_status_id, date_found, finder_id)
+    SELECT item_id, location_id, category_id, description, is_valuable, possible_owner_id, returned_to_id,
+           false, current_status_id, date_found, finder_id
+    FROM item_archive WHERE item_id = ANY(restored);
+
+    INSERT INTO status (status_id, item_id, action_taken_id, performed_by_id, timestamp, note)
+    SELECT status_id, item_id, action_taken_id, performed_by_id, timestamp, note
+    FROM status_archive WHERE item_id = ANY(restored);
+
+    INSERT INTO last_status (item_id, status_id, machine_name)
+    SELECT item.item_id, status.status_id, action.machine_name
+    FROM item
+    INNER JOIN status ON status.status_id = item.current_status_id
+    INNER JOIN action ON action.action_id = status.action_taken_id
+    WHERE item.item_id = ANY(restored);
+
+    DELETE FROM status_archive WHERE item_id = ANY(restored);
+    DELETE FROM item_archive WHERE item_id = ANY(restored);
+END
+$$;
+
+-- Keep the search columns of archived items up to date as well
+CREATE OR REPLACE FUNCTION item_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'category' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE category_id = NEW.category_id;
+        UPDATE item_archive SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE category_id = NEW.category_id;
+    ELSIF TG_TABLE_NAME = 'location' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE location_id = NEW.location_id;
+        UPDATE item_archive SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE location_id = NEW.location_id;
+    ELSE
+        UPDATE item SET
+            search_vector = item_search_vector(description, category_id, location_id, possible_owner_id),
+            search_text = item_search_text(description, possible_owner_id)
+        WHERE possible_owner_id = NEW.user_id;
+        UPDATE item_archive SET
+            search_vector = item_search_vector(description, category_id, location_id, possible_owner_id),
+            search_text = item_search_text(description, possible_owner_id)
+        WHERE possible_owner_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+-- Any items left behind for the valuable item digest keep is_archived set,
+-- and are moved by send_valuable_digest() once it has gone out
+SELECT move_items_to_archive(array_agg(item_id)) FROM item WHERE is_archived;
+DROP INDEX item_archived_idx;
+""", reverse_sql="""
+CREATE TEMPORARY TABLE unarchived AS SELECT item_id FROM item_archive;
+SELECT restore_items_from_archive(array_agg(item_id)) FROM unarchived;
+UPDATE item SET is_archived = true WHERE item_id IN (SELECT item_id FROM unarchived);
+DROP TABLE unarchived;
+CREATE INDEX item_archived_idx ON item (item_id DESC) WHERE is_archived;
+
+CREATE OR REPLACE FUNCTION item_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'category' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE category_id = NEW.category_id;
+    ELSIF TG_TABLE_NAME = 'location' THEN
+        UPDATE item SET search_vector = item_search_vector(description, category_id, location_id, possible_owner_id)
+        WHERE location_id = NEW.location_id;
+    ELSE
+        UPDATE item SET
+            search_vector = item_search_vector(description, category_id, location_id, possible_owner_id),
+            search_text = item_search_text(description, possible_owner_id)
+        WHERE possible_owner_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DROP FUNCTION restore_items_from_archive(integer[]);
+DROP FUNCTION move_items_to_archive(integer[]);
+ALTER TABLE item_archive DROP COLUMN search_text, DROP COLUMN search_vector;
+"""),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0027_item_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyItemStats',
+            fields=[
+                ('daily_item_stats_id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('location', models.ForeignKey(related_name='+', to='items.Location')),
+                ('category', models.ForeignKey(related_name='+', to='items.Category')),
+                ('action', models.ForeignKey(related_name='+', to='items.Action')),
+                ('count', models.IntegerField(default=0)),
+                ('valuable_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'daily_item_stats',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyitemstats',
+            unique_together=set([('day', 'location', 'category', 'action')]),
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_status_id', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'rollup_watermark',
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -1,17 +1,20 @@
-from django.db import models
+import re
+from django.db import models, connection, transaction
+from django.db.models import Q
 from its.users.models import User
 
 
 class LastStatus(models.Model):
-    # Because this is only a view in the database we want to
-    # do nothing when the parent object is deleted.
-    item = models.ForeignKey("items.Item", on_delete=models.DO_NOTHING)
-    status = models.ForeignKey("items.Status", on_delete=models.DO_NOTHING)
+    # One row per item pointing at its newest status. This is kept up to
+    # date by Status.save() and refresh_status_summary() so that filtering
+    # on the current action doesn't need to aggregate the status history.
+    item = models.OneToOneField("items.Item", primary_key=True)
+    status = models.ForeignKey("items.Status", related_name='+')
     machine_name = models.CharField(max_length=50)
 
     class Meta:
         db_table = "last_status"
-        managed = False
+        index_together = [("machine_name", "item")]
 
 
 class Action(models.Model):
@@ -51,6 +54,56 @@ class Status(models.Model):
     def __str__(self):
         return str(self.status_id)
 
+    def save(self, *args, **kwargs):
+
+        """
+        Keep the item's current status, found on and found by columns
+        and its last_status row in step with every new status that is written.
+        """
+
+        created = self.pk is None
+        super(Status, self).save(*args, **kwargs)
+
+        if created:
+            self.update_item_summary()
+
+    def update_item_summary(self):
+
+        """
+        Point the item at this status if it is the newest one, and record
+        when and by whom it was found if this is its first status.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE item SET
+                    current_status_id = GREATEST(current_status_id, %s),
+                    date_found = COALESCE(date_found, %s),
+                    finder_id = CASE WHEN date_found IS NULL THEN %s ELSE finder_id END
+                WHERE item_id = %s
+            """, [self.pk, self.timestamp, self.performed_by_id, self.item_id])
+
+            cursor.execute("""
+                INSERT INTO last_status (item_id, status_id, machine_name)
+                SELECT %s, %s, machine_name FROM action WHERE action_id = %s
+                ON CONFLICT (item_id) DO UPDATE SET
+                    status_id = EXCLUDED.status_id,
+                    machine_name = EXCLUDED.machine_name
+                WHERE last_status.status_id < EXCLUDED.status_id
+            """, [self.item_id, self.pk, self.action_taken_id])
+
+        # Keep an item instance that is already loaded in memory from
+        # writing stale values back over these columns when it is saved.
+        item = getattr(self, "_item_cache", None)
+
+        if item is not None:
+            if item.current_status_id is None or item.current_status_id < self.pk:
+                item.current_status = self
+
+            if item.date_found is None:
+                item.date_found = self.timestamp
+                item.finder_id = self.performed_by_id
+
 
 class Location(models.Model):
     location_id = models.AutoField(primary_key=True)
@@ -88,6 +141,81 @@ class Category(models.Model):
         return self.name
 
 
+def search_query(keywords):
+
+    """
+    Turn what the user typed into a prefix matching tsquery, "blue hyd" becomes
+    "blue:* & hyd:*". Returns None when there is too little to search on,
+    in which case a plain substring match is used instead.
+    """
+
+    words = re.findall(r"\w+", keywords)
+
+    if len("".join(words)) < 2:
+        return None
+
+    return " & ".join(word + ":*" for word in words)
+
+
+class ItemQuerySet(models.QuerySet):
+
+    def search(self, keywords):
+
+        """
+        Full text search over the item's description, category, location and
+        possible owner using the search_vector column. Each row gets a
+        search_rank that can be used for ordering. The rank is rounded to a
+        float8 so it survives the round trip through a pagination cursor
+        exactly; ts_rank's float4 doesn't.
+        """
+
+        query = search_query(keywords)
+
+        if query is None:
+            return self.filter(Q(description__icontains=keywords) | Q(possible_owner__last_name__icontains=keywords))
+
+        table = self.model._meta.db_table
+
+        return self.extra(
+            select={"search_rank": "round(ts_rank(%s.search_vector, to_tsquery('simple', %%s))::numeric, 6)::float8" % table},
+            select_params=[query],
+            where=["%s.search_vector @@ to_tsquery('simple', %%s)" % table],
+            params=[query],
+        )
+
+    def quick_search(self, text):
+
+        """
+        Fast substring search for the type-ahead box. Every word has to appear
+        in the item's description or possible owner's name, which the trigram
+        index on search_text can answer. Rows get a similarity for ordering.
+        """
+
+        words = text.lower().split()
+        like = ["%" + re.sub(r"([\\%_])", r"\\\1", word) + "%" for word in words]
+
+        table = self.model._meta.db_table
+
+        return self.extra(
+            select={"similarity": "similarity(%s.search_text, %%s)" % table},
+            select_params=[text.lower()],
+            where=["%s.search_text LIKE %%s" % table for word in words],
+            params=like,
+        )
+
+    def with_status_summary(self):
+
+        """
+        Load each item together with its current status (action, note and
+        performer), who found it and the rest of its related rows in a single
+        query, so listing pages cost the same no matter how many rows they show.
+        """
+
+        return self.select_related(
+            "location", "category", "possible_owner", "returned_to", "finder",
+            "current_status__action_taken", "current_status__performed_by")
+
+
 class Item(models.Model):
 
     is_valuable_help_text = "Select this box if the item is an ID, key(s), or is valued at $50 or more. Items valued over $50 are turned into CPSO as soon as possible. Student IDs are turned in the ID services window in the Neuberger Hall Lobby. Checking this box automatically generates an email for the item to be picked up from the lab. USB DRIVES ARE NOT VALUABLE."
@@ -99,7 +227,19 @@ class Item(models.Model):
     is_valuable = models.BooleanField(default=False, help_text=is_valuable_help_text)
     possible_owner = models.ForeignKey(User, related_name='item_possible_owner', null=True)
     returned_to = models.ForeignKey(User, related_name='item_returned_to', null=True)
+    # Archived items are moved to the item_archive table (ArchivedItem), so
+    # this is only True for an item that is waiting for the valuable item
+    # digest before it can be moved. The partial indexes for the active item
+    # lists are on NOT is_archived, and the list filters match them by
+    # filtering on is_archived=False.
     is_archived = models.BooleanField(default=False)
+    # These are copied from the status table whenever a status is written
+    # so that item listings don't need to query it once per row.
+    current_status = models.ForeignKey(Status, related_name='+', null=True, on_delete=models.SET_NULL)
+    date_found = models.DateTimeField(null=True)
+    finder = models.ForeignKey(User, related_name='item_finder', null=True, on_delete=models.SET_NULL)
+
+    objects = ItemQuerySet.as_manager()
 
     class Meta:
         db_table = "item"
@@ -107,13 +247,225 @@ class Item(models.Model):
     def __str__(self):
         return self.description
 
-    # This returns the last updated status, which is the first status
-    # it is currently first in the db.
+    # This returns the last updated status, which is kept in the
+    # current_status column.
+    def last_status(self):
+        return self.current_status
+
+    def found_on(self):
+        return self.date_found
+
+    def found_by(self):
+        return self.finder
+
+
+class ArchivedItem(models.Model):
+    # An item moved out of the item table by archive_items(), along with its
+    # statuses, so the active lists and their indexes only hold the items
+    # still being dealt with. The columns are the same as Item's, and the
+    # search columns are copied across too.
+    item_id = models.IntegerField(primary_key=True)
+    location = models.ForeignKey(Location)
+    category = models.ForeignKey(Category)
+    description = models.TextField()
+    is_valuable = models.BooleanField(default=False)
+    possible_owner = models.ForeignKey(User, related_name='archived_item_possible_owner', null=True)
+    returned_to = models.ForeignKey(User, related_name='archived_item_returned_to', null=True)
+    current_status = models.ForeignKey("items.ArchivedStatus", related_name='+', null=True, on_delete=models.SET_NULL)
+    date_found = models.DateTimeField(null=True)
+    finder = models.ForeignKey(User, related_name='archived_item_finder', null=True, on_delete=models.SET_NULL)
+    archived_on = models.DateTimeField()
+
+    is_archived = True
+
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        db_table = "item_archive"
+
+    def __str__(self):
+        return self.description
+
     def last_status(self):
-        return Status.objects.filter(item=self).first()
+        return self.current_status
 
     def found_on(self):
-        return Status.objects.filter(item=self).last().timestamp
+        return self.date_found
 
     def found_by(self):
-        return Status.objects.filter(item=self).last().performed_by
+        return self.finder
+
+
+class ArchivedStatus(models.Model):
+    # A status of an archived item, moved out of the status table with it.
+    status_id = models.IntegerField(primary_key=True)
+    item = models.ForeignKey(ArchivedItem)
+    action_taken = models.ForeignKey(Action)
+    performed_by = models.ForeignKey(User, null=True, default=None)
+    timestamp = models.DateTimeField()
+    note = models.TextField()
+
+    class Meta:
+        db_table = "status_archive"
+        ordering = ['-pk']
+
+    def __str__(self):
+        return str(self.status_id)
+
+
+class ValuableItemNotice(models.Model):
+    # A valuable item check in or return waiting to go out in the next staff
+    # digest email. Only written when VALUABLE_ITEM_DIGEST_WINDOW is set.
+    notice_id = models.AutoField(primary_key=True)
+    status = models.OneToOneField(Status, related_name='+')
+
+    class Meta:
+        db_table = "valuable_item_notice"
+
+
+class DailyItemStats(models.Model):
+    # How many statuses were given each day (in TIME_ZONE), by the item's
+    # location and category and the action taken, and how many of those
+    # were for valuable items. Kept up to date by manage.py rollup_stats
+    # for the reports page, which never reads the status table itself.
+    daily_item_stats_id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    location = models.ForeignKey(Location, related_name='+')
+    category = models.ForeignKey(Category, related_name='+')
+    action = models.ForeignKey(Action, related_name='+')
+    count = models.IntegerField(default=0)
+    valuable_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "daily_item_stats"
+        unique_together = [("day", "location", "category", "action")]
+
+
+class RollupWatermark(models.Model):
+    # The newest status already counted by each rollup
+    name = models.CharField(max_length=50, primary_key=True)
+    last_status_id = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "rollup_watermark"
+
+
+def refresh_status_summary(item_ids):
+
+    """
+    Recompute the current status, found on and found by columns and the
+    last_status rows for a set of items from the status table. Used by paths that write statuses in bulk
+    without going through Status.save().
+    """
+
+    item_ids = list(item_ids)
+
+    if not item_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE item SET
+                current_status_id = summary.last_status_id,
+                date_found = first_status.timestamp,
+                finder_id = first_status.performed_by_id
+            FROM (
+                SELECT item_id, MAX(status_id) AS last_status_id, MIN(status_id) AS first_status_id
+                FROM status
+                WHERE item_id = ANY(%s)
+                GROUP BY item_id
+            ) summary
+            INNER JOIN status first_status ON first_status.status_id = summary.first_status_id
+            WHERE item.item_id = summary.item_id
+        """, [item_ids])
+
+        cursor.execute("""
+            INSERT INTO last_status (item_id, status_id, machine_name)
+            SELECT item.item_id, status.status_id, action.machine_name
+            FROM item
+            INNER JOIN status ON status.status_id = item.current_status_id
+            INNER JOIN action ON action.action_id = status.action_taken_id
+            WHERE item.item_id = ANY(%s)
+            ON CONFLICT (item_id) DO UPDATE SET
+                status_id = EXCLUDED.status_id,
+                machine_name = EXCLUDED.machine_name
+        """, [item_ids])
+
+
+# Largest number of ids put in a single IN (...) list when updating items in bulk.
+BULK_CHUNK_SIZE = 1000
+
+
+def chunked(ids, size=BULK_CHUNK_SIZE):
+    ids = list(ids)
+
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def reserve_ids(model, count):
+
+    """
+    Take count values from the sequence behind model's primary key, so that
+    rows can be bulk created with ids that are known up front.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                       [model._meta.db_table, model._meta.pk.column, count])
+
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def archive_items(archive_ids, unarchive_ids):
+
+    """
+    Move items and their statuses into the archive tables, and others back
+    out of them, a chunk of ids per statement and all in a single
+    transaction. The moves are done by the move_items_to_archive() and
+    restore_items_from_archive() database functions. Items with a status
+    that is waiting for the valuable item digest are left where they are,
+    marked as archived, and moved by send_valuable_digest().
+
+    Returns the number of items archived and restored, and the number
+    skipped, either because they had to stay or weren't there to move.
+    """
+
+    counts = {"archived": 0, "restored": 0, "skipped": 0}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for chunk in chunked(archive_ids):
+            cursor.execute("SELECT moved, skipped FROM move_items_to_archive(%s)", [chunk])
+            moved, skipped = cursor.fetchone()
+            counts["archived"] += moved
+            counts["skipped"] += skipped
+
+        for chunk in chunked(unarchive_ids):
+            cursor.execute("SELECT moved, skipped FROM restore_items_from_archive(%s)", [chunk])
+            moved, skipped = cursor.fetchone()
+            counts["restored"] += moved
+            counts["skipped"] += skipped
+
+    return counts
+
+
+def apply_action(item_ids, action, note, performed_by):
+
+    """
+    Give every item in item_ids a new status for action, in a single
+    transaction. Each chunk of items costs one INSERT for the statuses, the
+    two statements of refresh_status_summary() and, when the items are
+    being checked back in, one UPDATE clearing who they were returned to.
+    """
+
+    with transaction.atomic():
+        for chunk in chunked(item_ids):
+            Status.objects.bulk_create([
+                Status(item_id=item_id, action_taken=action, note=note, performed_by=performed_by)
+                for item_id in chunk
+            ])
+
+            refresh_status_summary(chunk)
+
+            if action.machine_name == Action.CHECKED_IN:
+                Item.objects.filter(pk__in=chunk).update(returned_to=None)
@@ -0,0 +1,246 @@
+import base64
+import json
+from django.db.models import Q
+
+
+def encode_cursor(values):
+
+    """
+    Turn the sort key values of a row into an opaque string for a URL.
+    """
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+
+    """
+    Reverse encode_cursor. Returns None for anything that isn't a valid cursor.
+    """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+    return values if isinstance(values, list) else None
+
+
+def is_nullable(model, path):
+
+    """
+    Check if a field path such as possible_owner__last_name can be NULL,
+    either because the field itself is nullable or a foreign key on the way to it is.
+    """
+
+    for name in path.split("__"):
+        field = model._meta.get_field(name)
+
+        if field.null:
+            return True
+
+        if field.rel is not None:
+            model = field.rel.to
+
+    return False
+
+
+def key_value(obj, path):
+
+    """
+    Follow a field path from a model instance, for example item.possible_owner.last_name.
+    """
+
+    for name in path.split("__"):
+        if obj is None:
+            return None
+
+        obj = getattr(obj, name)
+
+    return obj
+
+
+class SortKey:
+
+    """
+    One column of a keyset ordering. PostgreSQL sorts NULL after every other
+    value, which is what the comparisons below assume.
+
+    A key can also be a value computed with QuerySet.extra(select=...), such as
+    a search rank, in which case expression holds its SQL and parameters.
+    """
+
+    def __init__(self, path, descending, nullable, expression=None):
+        self.path = path
+        self.descending = descending
+        self.nullable = nullable
+        self.expression = expression
+
+    @classmethod
+    def for_ordering(cls, queryset, ordering):
+        path = ordering.lstrip("-")
+
+        if path in queryset.query.extra_select:
+            return cls(path, ordering.startswith("-"), False, queryset.query.extra_select[path])
+
+        return cls(path, ordering.startswith("-"), is_nullable(queryset.model, path))
+
+    def reverse(self):
+        return SortKey(self.path, not self.descending, self.nullable, self.expression)
+
+    def sql(self, model):
+
+        """
+        The SQL for this key and its parameters, only for computed values and
+        columns on the model itself.
+        """
+
+        if self.expression is not None:
+            return "(%s)" % self.expression[0], list(self.expression[1])
+
+        return '"%s"."%s"' % (model._meta.db_table, model._meta.get_field(self.path).column), []
+
+    def order_by(self):
+        return ("-" if self.descending else "") + self.path
+
+    def equal(self, value):
+        if value is None:
+            return Q(**{self.path + "__isnull": True})
+
+        return Q(**{self.path: value})
+
+    def beyond(self, value):
+
+        """
+        Rows that come after value in this key's order, or None if there can't be any.
+        """
+
+        if self.descending:
+            if value is None:
+                return Q(**{self.path + "__isnull": False})
+
+            return Q(**{self.path + "__lt": value})
+
+        if value is None:
+            return None
+
+        beyond = Q(**{self.path + "__gt": value})
+
+        if self.nullable:
+            beyond |= Q(**{self.path + "__isnull": True})
+
+        return beyond
+
+
+def seek(queryset, keys, values):
+
+    """
+    Filter the queryset down to rows strictly after the row with the given key
+    values, (a > x) OR (a = x AND b > y) OR ...
+    """
+
+    if any(key.expression is not None for key in keys):
+        return seek_extra(queryset, keys, values)
+
+    condition = None
+    equal = Q()
+
+    for key, value in zip(keys, values):
+        beyond = key.beyond(value)
+
+        if beyond is not None:
+            condition = (equal & beyond) if condition is None else condition | (equal & beyond)
+
+        equal &= key.equal(value)
+
+    # Nothing can come after the cursor
+    return queryset.filter(condition if condition is not None else Q(pk__in=[]))
+
+
+def seek_extra(queryset, keys, values):
+
+    """
+    The same as seek(), written out as SQL for orderings that include computed
+    values. These can't be NULL and are only combined with columns of the model itself.
+    """
+
+    alternatives = []
+    params = []
+    equal = []
+    equal_params = []
+
+    for key, value in zip(keys, values):
+        sql, sql_params = key.sql(queryset.model)
+        alternatives.append("(%s)" % " AND ".join(equal + ["%s %s %%s" % (sql, "<" if key.descending else ">")]))
+        params.extend(equal_params + sql_params + [value])
+        equal.append("%s = %%s" % sql)
+        equal_params.extend(sql_params + [value])
+
+    return queryset.extra(where=["(%s)" % " OR ".join(alternatives)], params=params)
+
+
+class KeysetPage:
+
+    """
+    A page of rows along with the query strings for the pages either side of it.
+    """
+
+    def __init__(self, request, object_list, keys, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+        self.next_url = self.previous_url = None
+
+        if self.has_next:
+            self.next_url = self.url(request, "after", [key_value(object_list[-1], key.path) for key in keys])
+
+        if self.has_previous:
+            self.previous_url = self.url(request, "before", [key_value(object_list[0], key.path) for key in keys])
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @staticmethod
+    def url(request, direction, values):
+
+        """
+        Keep the current filter parameters and swap in the new cursor.
+        """
+
+        params = request.GET.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params[direction] = encode_cursor(values)
+        return "?" + params.urlencode()
+
+
+def paginate(request, queryset, ordering, per_page):
+
+    """
+    Return one KeysetPage of the queryset, ordered by ordering (a sequence of
+    order_by() style field names, the last of which must be unique). The page
+    is selected by the after or before cursor in the request's GET parameters,
+    so every page costs the same index range scan no matter how deep it is.
+    """
+
+    keys = [SortKey.for_ordering(queryset, field) for field in ordering]
+    after = decode_cursor(request.GET.get("after", ""))
+    before = decode_cursor(request.GET.get("before", ""))
+
+    if before is not None and len(before) == len(keys):
+        reversed_keys = [key.reverse() for key in keys]
+        rows = list(seek(queryset, reversed_keys, before).order_by(*[key.order_by() for key in reversed_keys])[:per_page + 1])
+        object_list = rows[:per_page][::-1]
+        return KeysetPage(request, object_list, keys, has_next=True, has_previous=len(rows) > per_page)
+
+    queryset = queryset.order_by(*[key.order_by() for key in keys])
+    has_previous = after is not None and len(after) == len(keys)
+
+    if has_previous:
+        queryset = seek(queryset, keys, after)
+
+    rows = list(queryset[:per_page + 1])
+    return KeysetPage(request, rows[:per_page], keys, has_next=len(rows) > per_page, has_previous=has_previous)
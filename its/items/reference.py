@@ -0,0 +1,151 @@
+import threading
+import time
+from django import forms
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from its.items.models import Action, Category, Location
+
+
+class ReferenceData:
+
+    """
+    Process wide cache of the Action, Category and Location tables.
+
+    Everything is loaded in one go and then served from memory. At most every
+    REFERENCE_DATA_CHECK_INTERVAL seconds the version stamp in the
+    reference_version table is read, and the tables are loaded again if
+    another process changed them. Changes made by this process drop the
+    cache straight away.
+    """
+
+    models = (Action, Category, Location)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = None
+        self.rows = {}
+        self.by_pk = {}
+        self.by_machine_name = {}
+
+    def invalidate(self):
+        self.version = None
+
+    def refresh(self):
+
+        """
+        Load the tables again if they changed since they were last loaded.
+        """
+
+        now = time.monotonic()
+
+        if self.version is not None and now - self.checked_at < settings.REFERENCE_DATA_CHECK_INTERVAL:
+            return
+
+        with self.lock:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT version FROM reference_version")
+                version = cursor.fetchone()[0]
+
+            if version != self.version:
+                rows = dict((model, list(model.objects.all())) for model in self.models)
+
+                # Swap in whole new lookups, so other threads never see a half built one.
+                self.by_pk = dict((model, dict((obj.pk, obj) for obj in rows[model])) for model in self.models)
+                self.by_machine_name = dict(
+                    (model, dict((obj.machine_name, obj) for obj in rows[model] if getattr(obj, "machine_name", None)))
+                    for model in self.models)
+                self.rows = rows
+
+            self.version = version
+            self.checked_at = now
+
+    def all(self, model):
+
+        """
+        Every row of the table, in the model's default ordering.
+        """
+
+        self.refresh()
+        return self.rows[model]
+
+    def get(self, model, pk=None, machine_name=None):
+
+        """
+        Look up a row by primary key or machine name. Returns None if there is no such row.
+        """
+
+        self.refresh()
+
+        if machine_name is not None:
+            return self.by_machine_name[model].get(machine_name)
+
+        return self.by_pk[model].get(pk)
+
+    def action(self, machine_name):
+        return self.get(Action, machine_name=machine_name)
+
+
+reference = ReferenceData()
+
+
+@receiver(post_save, sender=Action)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Action)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Location)
+def invalidate_reference_data(sender, **kwargs):
+    reference.invalidate()
+
+
+class ReferenceChoiceIterator:
+
+    """
+    Builds the choices from the cached rows when the widget is rendered.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+
+        for obj in reference.all(self.field.queryset.model):
+            yield (obj.pk, self.field.label_from_instance(obj))
+
+    def __len__(self):
+        return len(reference.all(self.field.queryset.model)) + (self.field.empty_label is not None)
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+
+    """
+    A ModelChoiceField for Action, Category or Location that takes its choices
+    and cleaned values from the reference data cache instead of querying.
+    """
+
+    def __init__(self, model, **kwargs):
+        super(ReferenceChoiceField, self).__init__(queryset=model.objects.all(), **kwargs)
+
+    def _get_choices(self):
+        return ReferenceChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+
+        try:
+            obj = reference.get(self.queryset.model, pk=int(value))
+        except (TypeError, ValueError):
+            obj = None
+
+        if obj is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+        return obj
@@ -0,0 +1,124 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from its.items.models import Action, DailyItemStats
+from its.items.reference import reference
+
+
+# The rollup_watermark row for daily_item_stats
+WATERMARK = "daily_item_stats"
+
+
+def rollup_daily_stats():
+
+    """
+    Add the statuses written since the last run to daily_item_stats, with
+    one aggregate query over the new range of status ids in the status and
+    status_archive tables. Statuses newer than ROLLUP_SETTLE_TIME seconds
+    are left for the next run, so a status whose transaction was still open
+    when its id was passed is not skipped. Returns the range of status ids
+    that was counted, or None if there was nothing new.
+    """
+
+    settled = timezone.now() - timedelta(seconds=settings.ROLLUP_SETTLE_TIME)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Only one run at a time
+        cursor.execute("INSERT INTO rollup_watermark (name, last_status_id) VALUES (%s, 0) ON CONFLICT (name) DO NOTHING", [WATERMARK])
+        cursor.execute("SELECT last_status_id FROM rollup_watermark WHERE name = %s FOR UPDATE", [WATERMARK])
+        since = cursor.fetchone()[0]
+
+        cursor.execute("""
+            SELECT greatest(
+                (SELECT max(status_id) FROM status WHERE timestamp < %s),
+                (SELECT max(status_id) FROM status_archive WHERE timestamp < %s)
+            )
+        """, [settled, settled])
+        until = cursor.fetchone()[0]
+
+        if until is None or until <= since:
+            return None
+
+        cursor.execute("""
+            INSERT INTO daily_item_stats (day, location_id, category_id, action_id, count, valuable_count)
+            SELECT
+                (new.timestamp AT TIME ZONE %s)::date,
+                item.location_id,
+                item.category_id,
+                new.action_taken_id,
+                count(*),
+                count(*) FILTER (WHERE item.is_valuable)
+            FROM (
+                SELECT item_id, action_taken_id, timestamp FROM status WHERE status_id > %s AND status_id <= %s
+                UNION ALL
+                SELECT item_id, action_taken_id, timestamp FROM status_archive WHERE status_id > %s AND status_id <= %s
+            ) AS new
+            INNER JOIN (
+                SELECT item_id, location_id, category_id, is_valuable FROM item
+                UNION ALL
+                SELECT item_id, location_id, category_id, is_valuable FROM item_archive
+            ) AS item ON item.item_id = new.item_id
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (day, location_id, category_id, action_id) DO UPDATE SET
+                count = daily_item_stats.count + EXCLUDED.count,
+                valuable_count = daily_item_stats.valuable_count + EXCLUDED.valuable_count
+        """, [settings.TIME_ZONE, since, until, since, until])
+
+        cursor.execute("UPDATE rollup_watermark SET last_status_id = %s WHERE name = %s", [until, WATERMARK])
+
+    return since + 1, until
+
+
+def rebuild_daily_stats():
+
+    """
+    Empty daily_item_stats and count every status again.
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM daily_item_stats")
+        cursor.execute("DELETE FROM rollup_watermark WHERE name = %s", [WATERMARK])
+
+        return rollup_daily_stats()
+
+
+def found_by_place(start, end):
+
+    """
+    The number of items checked in between start and end, and how many of
+    them were valuable, for each location and category.
+    """
+
+    return list(DailyItemStats.objects.filter(day__range=(start, end), action=reference.action(Action.CHECKED_IN)).values(
+        "location__name", "category__name").annotate(found=Sum("count"), valuable=Sum("valuable_count")).order_by(
+        "location__name", "category__name"))
+
+
+def outcomes(start, end):
+
+    """
+    How many times each action other than checking in was taken between
+    start and end, and its share of all of them.
+    """
+
+    rows = list(DailyItemStats.objects.filter(day__range=(start, end)).exclude(action=reference.action(Action.CHECKED_IN)).values(
+        "action__name").annotate(total=Sum("count")).order_by("-total"))
+    total = sum(row["total"] for row in rows)
+
+    for row in rows:
+        row["share"] = 100.0 * row["total"] / total
+
+    return rows
+
+
+def monthly_volume(start, end):
+
+    """
+    The number of items and valuable items checked in each month between start and end.
+    """
+
+    return list(DailyItemStats.objects.filter(day__range=(start, end), action=reference.action(Action.CHECKED_IN)).extra(
+        select={"month": "date_trunc('month', day)::date"}).values("month").annotate(
+        found=Sum("count"), valuable=Sum("valuable_count")).order_by("month"))
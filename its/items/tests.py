@@ -1,17 +1,38 @@
 import unittest
 import os
-from django.test import TestCase
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from django.test import TestCase, RequestFactory
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import override_settings
+from django.core.management import call_command
+from django.utils import timezone
 from model_mommy.mommy import make
-from its.users.models import User
-from its.items.models import Item, Location, Category, Action, Status
-from its.items.forms import AdminActionForm, AdminItemFilterForm, ItemFilterForm, ItemArchiveForm, CheckInForm, check_ldap
+from its.users.models import User, DirectoryEntry
+from its.items.models import Item, ArchivedItem, ArchivedStatus, Location, Category, Action, Status, LastStatus, ValuableItemNotice, DailyItemStats
+from its.items.models import refresh_status_summary, archive_items
+from its.items.forms import AdminActionForm, BulkActionForm, AdminItemFilterForm, ItemFilterForm, ItemArchiveForm, CheckInForm
+from its.items.forms import check_ldap, known_usernames, unknown_usernames
+from its.items import forms
+from its.items.pagination import paginate
+from its.items import autocomplete
+from its.items.autocomplete import PrefixCache
+from its.items.reference import reference, ReferenceChoiceField
+from its.items.digest import send_valuable_digest
+from its.items.reports import rollup_daily_stats, found_by_place, outcomes, monthly_volume
+from its.jobs.models import Job, OutboxMessage, run_pending
+from its.jobs.outbox import drain_outbox
+from its import backends
 from its.backends import ITSBackend
-from unittest.mock import patch, Mock
-
-
+from its.ldap import LDAPPool, LDAPPoolTimeout
+from ldap3.core.exceptions import LDAPSocketReceiveError
+from unittest.mock import patch, Mock, MagicMock
 
 
 def create_user():
@@ -49,6 +70,7 @@ def create_staff():
     user.save()
     return user
 
+
 @unittest.skipIf("TRAVIS" in os.environ and os.environ["TRAVIS"] == "true", "Skipping this test on Travis CI.")
 class ITSBackendTest(TestCase):
     
@@ -69,10 +91,58 @@ class ITSBackendTest(TestCase):
         backend.get_or_init_user(username)
 
         self.assertEqual(1, User.objects.all().count())
-        
-        
 
-    
+
+class ITSBackendRoleTest(TestCase):
+
+    def setUp(self):
+        backends.role_cache.clear()
+
+    def ldapsearch(self, query, using='default'):
+        if using == 'groups':
+            return [('cn=jdoe', {'memberOf': ['CN=ITS_LAB_Students_GG,OU=Groups,DC=psu,DC=ds,DC=pdx,DC=edu']})]
+
+        return []
+
+    def test_group_names(self):
+        self.assertEqual(backends.group_names(["CN=TLC_GG,OU=Groups,DC=pdx", "cn=Other, OU=Groups", "OU=NotAGroup"]), set(["TLC_GG", "OTHER"]))
+
+    def test_get_or_init_user(self):
+
+        """
+        Check that a lab attendant is created on their first login, and that
+        logging in again within the cache TTL neither searches LDAP nor writes the row.
+        """
+
+        profile = {'first_name': "Jane", 'last_name': "Doe", 'email': "jdoe@pdx.edu"}
+
+        with patch("its.backends.ldapsearch", side_effect=self.ldapsearch) as ldapsearch:
+            with patch("its.backends.parse_profile", return_value=profile):
+                user = ITSBackend().get_or_init_user("jdoe")
+
+                self.assertEqual(ldapsearch.call_count, 2)
+                self.assertEqual((user.first_name, user.is_active, user.is_staff), ("Jane", True, False))
+
+                with self.assertNumQueries(1):
+                    self.assertEqual(ITSBackend().get_or_init_user("jdoe"), user)
+
+                self.assertEqual(ldapsearch.call_count, 2)
+
+    def test_not_in_a_group(self):
+
+        """
+        Check that people in none of the groups can't log in.
+        """
+
+        results = {'groups': [('cn=jdoe', {'memberOf': ['CN=Students,OU=Groups']})], 'default': []}
+
+        with patch("its.backends.ldapsearch", side_effect=lambda query, using='default': results[using]):
+            with patch("its.backends.parse_profile", return_value={'first_name': "", 'last_name': "", 'email': ""}):
+                self.assertIsNone(ITSBackend().get_or_init_user("jdoe"))
+
+        self.assertFalse(User.objects.exists())
+
+
 class PrintoffTest(TestCase):
 
     def test_login_required(self):
@@ -235,6 +305,23 @@ class AdminActionTest(TestCase):
         self.assertEqual(200, response.status_code)
         self.assertIn(new_item.description, response.content.decode())
 
+    def test_get_archived(self):
+
+        """
+        Tests that the view shows an archived item and its status log.
+        """
+
+        user = create_staff()
+        self.client.login(username=user.username, password="password")
+
+        new_item = make(Item, is_archived=False)
+        make(Status, item=new_item, note="Left in the lab")
+        archive_items([new_item.pk], [])
+
+        response = self.client.get(reverse("admin-action", args=[new_item.pk]))
+        self.assertContains(response, new_item.description)
+        self.assertContains(response, "Left in the lab")
+
 
 class AdminItemlistTest(TestCase):
 
@@ -289,6 +376,9 @@ class AdminItemlistTest(TestCase):
                 request = self.client.post(reverse("admin-itemlist"), form)
                 self.assertRedirects(request, reverse("admin-itemlist"))
 
+        # The message comes from the form's counts, not save()'s result
+        self.assertContains(self.client.get(reverse("admin-itemlist")), "0 items archived, 0 unarchived")
+
     def test_invalid_archive_post(self):
 
         """
@@ -305,9 +395,87 @@ class AdminItemlistTest(TestCase):
                 request = self.client.post(reverse("admin-itemlist"), form)
                 self.assertEqual(200, request.status_code)
 
+    def test_bulk_action_post(self):
+
+        """
+        Tests that taking an action on the selected items sends the user back
+        to the admin itemlist page.
+        """
+
+        user = create_staff()
+        self.client.login(username=user.username, password="password")
+
+        with patch('its.items.views.BulkActionForm.is_valid', return_value=True):
+            with patch('its.items.views.BulkActionForm.save', return_value=2) as save:
+                request = self.client.post(reverse("admin-itemlist"), {'action': "Take action"})
+                self.assertRedirects(request, reverse("admin-itemlist"))
+                self.assertEqual(save.call_args[1]['current_user'], user)
+
 
 # Form tests
 
+
+class ItemSearchTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def test_login_required(self):
+
+        """
+        Tests that the view sends the unauthenticated user to the login page.
+        """
+
+        response = self.client.get(reverse("items-search"))
+        self.assertRedirects(response, reverse("login") + "?next=/items/search", target_status_code=302)
+
+    def test_get(self):
+
+        """
+        Tests that only active items matching every word, in the description or
+        the possible owner's name, are returned.
+        """
+
+        user = create_user()
+        self.client.login(username=user.username, password="password")
+
+        owner = create_full_user("Jane", "Doe", "jdoe@pdx.edu")
+        bottle = make(Item, description="Blue hydro flask", possible_owner=owner)
+        make(Status, item=bottle, action_taken=Action.objects.get(machine_name=Action.CHECKED_IN))
+        make(Item, description="Blue hydro flask", is_archived=True)
+        make(Item, description="Blue notebook")
+
+        response = self.client.get(reverse("items-search"), {"query": "hydro DOE"})
+        self.assertEqual(200, response.status_code)
+
+        results = json.loads(response.content.decode())
+        self.assertEqual([result["id"] for result in results], [bottle.pk])
+        self.assertEqual(results[0]["status"], "Checked in")
+
+        response = self.client.get(reverse("items-search"), {"query": "b"})
+        self.assertEqual(response.content.decode(), "[]")
+
+    def test_checked_in_only(self):
+
+        """
+        Tests that the item list's search only returns checked in items, as
+        the list itself does, while staff can find the others.
+        """
+
+        user = create_staff()
+        self.client.login(username=user.username, password="password")
+
+        bottle = make(Item, description="Blue hydro flask")
+        make(Status, item=bottle, action_taken=Action.objects.get(machine_name=Action.CHECKED_IN))
+        disposed = make(Item, description="Red hydro flask")
+        make(Status, item=disposed, action_taken=Action.objects.get(machine_name=Action.DISPOSED))
+
+        response = self.client.get(reverse("items-search"), {"query": "hydro", "checked_in": "1"})
+        self.assertEqual([result["id"] for result in json.loads(response.content.decode())], [bottle.pk])
+
+        response = self.client.get(reverse("items-search"), {"query": "hydro"})
+        self.assertEqual(sorted(result["id"] for result in json.loads(response.content.decode())), [bottle.pk, disposed.pk])
+
+
 class CheckInFormTest(TestCase):
 
     fixtures = ["actions.json"]
@@ -535,6 +703,40 @@ class CheckInFormTest(TestCase):
                 self.assertEquals(mail.outbox[0].subject, 'An item belonging to you was found')
                 self.assertEquals(mail.outbox[1].subject, 'Valuable item checked in')
 
+    @override_settings(JOBS_ALWAYS_EAGER=False)
+    def test_save_queues_emails(self):
+
+        """
+        Checks that the emails are left to the worker instead of being sent during the request.
+        """
+
+        new_item = make(Item, is_valuable=True)
+        data = {'location': new_item.location,
+                'category': new_item.category,
+                'description': new_item.description,
+                'is_valuable': new_item.is_valuable,
+                'username': "",
+                'possible_owner_found': True,
+                'first_name': "test",
+                'last_name': "test",
+                'email': "test@test.com", }
+
+        user = create_user()
+
+        with patch('its.items.forms.CheckInForm.clean', return_value=data):
+            form = CheckInForm(data)
+            form.cleaned_data = data
+            with patch("its.items.forms.ModelForm.save", return_value=new_item):
+                form.save(current_user=user)
+
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(OutboxMessage.objects.count(), 2)
+        self.assertEquals(list(Job.objects.values_list("task", flat=True)), ["its.jobs.outbox.drain_outbox"])
+
+        run_pending()
+
+        self.assertEquals(len(mail.outbox), 2)
+
 
 class ItemArchiveFormTest(TestCase):
 
@@ -543,27 +745,20 @@ class ItemArchiveFormTest(TestCase):
     def test_init(self):
 
         """
-        Tests that the fields of the form are appended with archive fields.
+        Tests that the form keeps the archived status of the listed items
+        without adding a field per item.
         """
 
-        user = create_staff()
-        self.client.login(username=user.username, password="password")
-
-        new_item = make(Item)
+        new_item = make(Item, is_archived=False)
         new_action = Action.objects.get(machine_name=Action.CHECKED_IN)
         make(Status, action_taken=new_action, item=new_item)
-        make(Category)
-        make(Location)
 
         item_filter_form = AdminItemFilterForm(None)
         item_list = item_filter_form.filter()
 
-        request = self.client.post(reverse("admin-itemlist"))
-
-        archive_key = 'archive-' + str(new_item.pk)
-
-        item_archive_form = ItemArchiveForm(request, item_list=item_list)
-        self.assertTrue(item_archive_form.fields[archive_key])
+        item_archive_form = ItemArchiveForm(item_list=item_list)
+        self.assertEqual(item_archive_form.archived, {new_item.pk: False})
+        self.assertEqual(len(item_archive_form.fields), 2)
 
     def test_save(self):
 
@@ -571,35 +766,68 @@ class ItemArchiveFormTest(TestCase):
         Checks that the archived status of items is updated.
         """
 
-        user = create_staff()
-        self.client.login(username=user.username, password="password")
-
         new_item = make(Item, is_archived=False)
         new_action = Action.objects.get(machine_name=Action.CHECKED_IN)
         make(Status, action_taken=new_action, item=new_item)
-        make(Category)
-        make(Location)
 
         item_filter_form = AdminItemFilterForm(None)
         item_list = item_filter_form.filter()
 
-        request = self.client.post(reverse("admin-itemlist"))
+        data = {'archived_ids': [str(new_item.pk)], 'changed_ids': str(new_item.pk)}
+        item_archive_form = ItemArchiveForm(data, item_list=item_list)
+
+        self.assertTrue(item_archive_form.is_valid())
+        item_archive_form.save()
+
+        self.assertFalse(Item.objects.filter(pk=new_item.pk).exists())
+        self.assertTrue(ArchivedItem.objects.get(pk=new_item.pk).is_archived)
+
+    def test_save_archive_and_unarchive(self):
+
+        """
+        Checks that items are archived and unarchived together, that only
+        changed items are touched, that ids not in the list are ignored, and
+        that nothing is reported as changed when nothing was.
+        """
 
-        archive_key = 'archive-' + str(new_item.pk)
+        archived_item = make(Item, is_archived=False)
+        active_item = make(Item, is_archived=False)
+        other_item = make(Item, is_archived=False)
+        archive_items([archived_item.pk], [])
+        item_list = [ArchivedItem.objects.get(pk=archived_item.pk), Item.objects.get(pk=active_item.pk)]
+
+        # Without javascript, every item on the page is compared.
+        data = {'archived_ids': [str(active_item.pk), str(other_item.pk)]}
+        item_archive_form = ItemArchiveForm(data, item_list=item_list)
+        self.assertTrue(item_archive_form.is_valid())
+        self.assertTrue(item_archive_form.save())
+        self.assertEqual(item_archive_form.counts, {"archived": 1, "restored": 1, "skipped": 0})
 
-        item_archive_form = ItemArchiveForm(request, item_list=item_list)
+        self.assertFalse(Item.objects.get(pk=archived_item.pk).is_archived)
+        self.assertTrue(ArchivedItem.objects.filter(pk=active_item.pk).exists())
+        self.assertFalse(Item.objects.get(pk=other_item.pk).is_archived)
 
+        # Only the items listed as changed are touched.
+        item_list = [Item.objects.get(pk=archived_item.pk), ArchivedItem.objects.get(pk=active_item.pk)]
+        data = {'archived_ids': [str(archived_item.pk)], 'changed_ids': ''}
+        item_archive_form = ItemArchiveForm(data, item_list=item_list)
         self.assertTrue(item_archive_form.is_valid())
-        item_archive_form.cleaned_data[archive_key] = True
-        item_archive_form.save()
+        self.assertFalse(item_archive_form.save())
+        self.assertFalse(Item.objects.get(pk=archived_item.pk).is_archived)
 
-        new_item = Item.objects.get(pk=new_item.pk)
-        self.assertTrue(new_item.is_archived)
+    def test_invalid_ids(self):
+
+        """
+        Checks that ids that are not numbers make the form invalid.
+        """
+
+        item_archive_form = ItemArchiveForm({'archived_ids': ['abc']}, item_list=[])
+        self.assertFalse(item_archive_form.is_valid())
 
-    def test_iter(self):
+    def test_template(self):
 
         """
-        Checks that the iter method updates the requested page with the correct archive fields.
+        Checks that the admin item list renders an archive checkbox for each item.
         """
 
         user = create_staff()
@@ -608,17 +836,10 @@ class ItemArchiveFormTest(TestCase):
         new_item = make(Item, is_archived=False)
         new_action = Action.objects.get(machine_name=Action.CHECKED_IN)
         make(Status, action_taken=new_action, item=new_item)
-        make(Category)
-        make(Location)
-
-        request = self.client.post(reverse("admin-itemlist"))
-
-        item_filter_form = AdminItemFilterForm(None)
-        item_filter_form.filter()
 
         request = self.client.get(reverse("admin-itemlist"))
 
-        expected_text = "archive-" + str(new_item.pk)
+        expected_text = 'name="archived_ids" value="%d"' % new_item.pk
         self.assertContains(request, expected_text, status_code=200, html=False)
 
 
@@ -664,7 +885,8 @@ class AdminItemFilterFormTest(TestCase):
 
         # Test 2 - Archived item
 
-        new_item2 = make(Item, is_archived=True, is_valuable=True)
+        new_item2 = make(Item, is_archived=False, is_valuable=True)
+        archive_items([new_item2.pk], [])
 
         data = {'select_items': "archived",
                 'select_location': None,
@@ -734,6 +956,78 @@ class AdminItemFilterFormTest(TestCase):
 
             self.assertEqual(values.get()['item_id'], new_item5.pk)
 
+    def test_keyword_search(self):
+
+        """
+        Check that the keyword search matches word prefixes across the description,
+        category, location and possible owner, and follows renamed categories.
+        """
+
+        owner = create_full_user("Jane", "Doe", "jdoe@pdx.edu")
+        category = make(Category, name="Water bottle")
+        bottle = make(Item, description="Blue hydro flask", category=category, possible_owner=owner)
+        make(Item, description="Red notebook")
+
+        for keywords in ("blue hydro", "hydr", "BOTTLE", "doe", "jdoe"):
+            self.assertEqual([item.pk for item in Item.objects.search(keywords)], [bottle.pk])
+
+        category.name = "Flasks"
+        category.save()
+        self.assertEqual([item.pk for item in Item.objects.search("flasks")], [bottle.pk])
+
+        # Single characters fall back to substring matching
+        self.assertEqual(len(Item.objects.search("e")), 2)
+
+    def test_ranked_pages(self):
+
+        """
+        Check that keyword searches without a sorting order are ordered by rank,
+        and can be paged through, including across rows with the same rank.
+        """
+
+        for i in range(7):
+            make(Item, description="flask " * (i % 3 + 1))
+
+        data = {'select_items': "active",
+                'keyword_or_last_name': "flask",
+                'sort_by': '', }
+
+        item_filter_form = AdminItemFilterForm(data)
+        self.assertEqual(item_filter_form.ordering(), ('-search_rank', '-item_id'))
+
+        expected = [item.pk for item in item_filter_form.filter()]
+        factory = RequestFactory()
+        request = factory.get("/items/admin-itemlist", data)
+        seen = []
+
+        while True:
+            page = paginate(request, item_filter_form.filter(), item_filter_form.ordering(), 2)
+            seen.extend(item.pk for item in page)
+
+            if not page.has_next:
+                break
+
+            request = factory.get("/items/admin-itemlist" + page.next_url)
+
+        self.assertEqual(seen, expected)
+
+    def test_valuable_excludes_archived(self):
+
+        """
+        Checks that the valuable filter lists the valuable items that haven't
+        been archived, and the archived filter lists the ones that have.
+        """
+
+        active_item = make(Item, is_archived=False, is_valuable=True)
+        archived_item = make(Item, is_archived=False, is_valuable=True)
+        archive_items([archived_item.pk], [])
+
+        item_list = AdminItemFilterForm({'select_items': "valuable", 'sort_by': ''}).filter()
+        self.assertEqual([item.pk for item in item_list], [active_item.pk])
+
+        item_list = AdminItemFilterForm({'select_items': "archived", 'sort_by': ''}).filter()
+        self.assertEqual([item.pk for item in item_list], [archived_item.pk])
+
 
 class ItemFilterFormTest (TestCase):
 
@@ -766,6 +1060,12 @@ class ItemFilterFormTest (TestCase):
         self.assertEqual(values[0]['item_id'], new_item1.pk)
         self.assertEqual(len(values), 1)
 
+        # Returning the item takes it off the list.
+        make(Status, action_taken=new_action2, item=new_item1)
+
+        item_filter_form = ItemFilterForm(data)
+        self.assertEqual(len(item_filter_form.filter()), 0)
+
 
 class AdminActionFormTest (TestCase):
 
@@ -1044,29 +1344,992 @@ class AdminActionFormTest (TestCase):
 
                 self.assertEqual(num_users, User.objects.all().count())
 
+    def test_save_archived(self):
 
-# Helper function tests
+        """
+        Checks that an archived item can be given a new status, and stays archived.
+        """
 
-class checkLdapTest(TestCase):
+        user = create_staff()
+        new_item = make(Item, is_archived=False)
+        Status(item=new_item, action_taken=Action.objects.get(machine_name=Action.CHECKED_IN), note="").save()
+        archive_items([new_item.pk], [])
 
-    def test_ldap_return_true(self):
+        form = AdminActionForm({}, current_user=user)
+        form.cleaned_data = {'action_choice': Action.objects.get(machine_name=Action.OTHER), 'note': "Found the owner",
+                             'first_name': "", 'last_name': "", 'email': ""}
+        form.save(item_pk=new_item.pk, current_user=user)
+
+        self.assertFalse(Item.objects.filter(pk=new_item.pk).exists())
+        archived = ArchivedItem.objects.with_status_summary().get(pk=new_item.pk)
+        self.assertEqual(archived.current_status.note, "Found the owner")
+        self.assertEqual(ArchivedStatus.objects.filter(item=archived).count(), 2)
+
+
+class ItemStatusSummaryTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def test_status_save(self):
 
         """
-        Check that the correct value of True is returned for a username
-        that is in LDAP.
+        Check that writing a status updates the item's current status, and that
+        only the first status sets when and by whom the item was found.
         """
 
-        with patch('its.items.forms.ldapsearch', return_value=True):
-            user = check_ldap("test12345")
-            self.assertTrue(user)
+        finder = create_user()
+        staff = create_staff()
+        new_item = make(Item)
 
-    def test_ldap_return_false(self):
+        first_status = Status(item=new_item, action_taken=Action.objects.get(machine_name=Action.CHECKED_IN), note="", performed_by=finder)
+        first_status.save()
+        second_status = Status(item=new_item, action_taken=Action.objects.get(machine_name=Action.CPSO), note="", performed_by=staff)
+        second_status.save()
+
+        # The in memory instance is kept in step too.
+        self.assertEqual(new_item.current_status, second_status)
+
+        new_item = Item.objects.get(pk=new_item.pk)
+        self.assertEqual(new_item.last_status(), second_status)
+        self.assertEqual(new_item.found_on(), first_status.timestamp)
+        self.assertEqual(new_item.found_by(), finder)
+
+        last_status = LastStatus.objects.get(item=new_item)
+        self.assertEqual(last_status.status, second_status)
+        self.assertEqual(last_status.machine_name, Action.CPSO)
+
+    def test_refresh_status_summary(self):
 
         """
-        Check that the correct value of False is returned for a username that
-        is not in LDAP.
+        Check that statuses written in bulk are picked up by refresh_status_summary.
         """
 
-        with patch('its.items.forms.ldapsearch', return_value=False):
-            user = check_ldap("test12345")
-            self.assertFalse(user)
+        finder = create_user()
+        new_item = make(Item)
+        new_action = Action.objects.get(machine_name=Action.CHECKED_IN)
+
+        Status.objects.bulk_create([
+            Status(item=new_item, action_taken=new_action, note="", performed_by=finder),
+            Status(item=new_item, action_taken=new_action, note="", performed_by=None),
+        ])
+
+        refresh_status_summary([new_item.pk])
+
+        new_item = Item.objects.get(pk=new_item.pk)
+        self.assertEqual(new_item.current_status, Status.objects.filter(item=new_item).first())
+        self.assertEqual(new_item.finder, finder)
+        self.assertEqual(LastStatus.objects.get(item=new_item).status, new_item.current_status)
+
+    def test_with_status_summary(self):
+
+        """
+        Check that a listing page worth of items and everything the templates
+        show for them is loaded in a single query.
+        """
+
+        finder = create_user()
+        new_action = Action.objects.get(machine_name=Action.CHECKED_IN)
+
+        for i in range(5):
+            new_item = make(Item, possible_owner=create_full_user("test", "test%d" % i, "test%d@pdx.edu" % i))
+            make(Status, item=new_item, action_taken=new_action, performed_by=finder)
+
+        with self.assertNumQueries(1):
+            for item in AdminItemFilterForm(None).filter():
+                str(item.location)
+                str(item.category)
+                str(item.possible_owner)
+                str(item.returned_to)
+                str(item.found_by())
+                str(item.last_status().action_taken)
+                str(item.last_status().performed_by)
+
+
+class PaginateTest(TestCase):
+
+    def page_through(self, ordering, per_page):
+
+        """
+        Follow the next links from the first page to the last one, then the
+        previous links back again, and return the item ids seen each way.
+        """
+
+        factory = RequestFactory()
+        request = factory.get("/items/admin-itemlist", {"action": "Filter"})
+        forward = []
+
+        while True:
+            page = paginate(request, Item.objects.all(), ordering, per_page)
+            forward.extend(item.pk for item in page)
+
+            if not page.has_next:
+                break
+
+            request = factory.get("/items/admin-itemlist" + page.next_url)
+
+        backward = []
+
+        while page.has_previous:
+            request = factory.get("/items/admin-itemlist" + page.previous_url)
+            page = paginate(request, Item.objects.all(), ordering, per_page)
+            backward = [item.pk for item in page] + backward
+
+        return forward, backward
+
+    def test_paginate(self):
+
+        """
+        Check that paging through every sort order visits each item once in the
+        same order as the unpaginated queryset, including NULL possible owners.
+        """
+
+        location = make(Location, name="b")
+
+        for i in range(4):
+            make(Item, location=location, description="same")
+            make(Item, location=make(Location, name="a"), description=str(i), possible_owner=create_full_user("test", "test%d" % (i % 2), "test%d@pdx.edu" % i))
+
+        for ordering in AdminItemFilterForm.sort_keys.values():
+            expected = list(Item.objects.order_by(*ordering).values_list("pk", flat=True))
+            forward, backward = self.page_through(ordering, 3)
+
+            self.assertEqual(forward, expected)
+            self.assertEqual(backward, expected[:len(backward)])
+
+    def test_keep_filter(self):
+
+        """
+        Check that the page links keep the filter parameters.
+        """
+
+        for i in range(3):
+            make(Item)
+
+        request = RequestFactory().get("/items/itemlist", {"action": "Filter", "sort_by": "pk"})
+        page = paginate(request, Item.objects.all(), ("item_id",), 2)
+
+        self.assertIn("sort_by=pk", page.next_url)
+        self.assertIn("action=Filter", page.next_url)
+        self.assertIsNone(page.previous_url)
+
+
+class ReferenceDataTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def test_lookups(self):
+
+        """
+        Check that rows can be found by primary key and machine name, and that
+        once loaded no queries are made.
+        """
+
+        location = make(Location, name="Lab")
+        checked_in = Action.objects.get(machine_name=Action.CHECKED_IN)
+        actions = list(Action.objects.all())
+
+        with override_settings(REFERENCE_DATA_CHECK_INTERVAL=60):
+            reference.refresh()
+
+            with self.assertNumQueries(0):
+                self.assertEqual(reference.action(Action.CHECKED_IN), checked_in)
+                self.assertEqual(reference.get(Location, pk=location.pk).name, "Lab")
+                self.assertIsNone(reference.get(Location, pk=location.pk + 1))
+                self.assertEqual(list(reference.all(Action)), actions)
+
+    def test_invalidate(self):
+
+        """
+        Check that saving a row drops the cache straight away, and that a change
+        made by another process is picked up once the check interval has passed.
+        """
+
+        location = make(Location, name="Lab")
+
+        with override_settings(REFERENCE_DATA_CHECK_INTERVAL=60):
+            self.assertEqual(reference.get(Location, pk=location.pk).name, "Lab")
+
+            location.name = "Library"
+            location.save()
+            self.assertEqual(reference.get(Location, pk=location.pk).name, "Library")
+
+            # Another process changing the table commits a new version stamp.
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE location SET name = 'Annex' WHERE location_id = %s", [location.pk])
+                cursor.execute("UPDATE reference_version SET version = -1")
+
+            self.assertEqual(reference.get(Location, pk=location.pk).name, "Library")
+
+            reference.checked_at -= 60
+            self.assertEqual(reference.get(Location, pk=location.pk).name, "Annex")
+
+    def test_choice_field(self):
+
+        """
+        Check that the choice field lists and cleans cached rows.
+        """
+
+        location = make(Location, name="Lab")
+        field = ReferenceChoiceField(Location, required=False)
+
+        self.assertIn((location.pk, "Lab"), list(field.choices))
+        self.assertEqual(field.clean(str(location.pk)), location)
+        self.assertIsNone(field.clean(""))
+        self.assertRaises(ValidationError, field.clean, "Lab")
+        self.assertRaises(ValidationError, field.clean, str(location.pk + 1))
+
+
+@override_settings(VALUABLE_ITEM_DIGEST_WINDOW=3600, JOBS_ALWAYS_EAGER=False,
+                   CHECKIN_EMAIL_TO=["staff@example.com"], CHECKOUT_EMAIL_TO=["staff@example.com"])
+class ValuableDigestTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def test_digest(self):
+
+        """
+        Check that valuable check ins and returns are collected into one email,
+        without looking up each item's status history.
+        """
+
+        user = create_staff()
+        returned = make(Item, is_valuable=True, description="Silver watch")
+        Status(item=returned, action_taken=reference.action(Action.CHECKED_IN), performed_by=user, note="").save()
+
+        for description in ["Blue laptop", "Gold ring"]:
+            new_item = make(Item, is_valuable=True, description=description)
+            data = {'location': new_item.location,
+                    'category': new_item.category,
+                    'description': description,
+                    'is_valuable': True,
+                    'username': "",
+                    'possible_owner_found': False,
+                    'first_name': "",
+                    'last_name': "",
+                    'email': "", }
+
+            with patch('its.items.forms.CheckInForm.clean', return_value=data):
+                form = CheckInForm(data)
+                form.cleaned_data = data
+                with patch("its.items.forms.ModelForm.save", return_value=new_item):
+                    form.save(current_user=user)
+
+        form = AdminActionForm({}, current_user=user)
+        form.cleaned_data = {'action_choice': reference.action(Action.RETURNED), 'note': "",
+                             'first_name': "Ann", 'last_name': "Owner", 'email': "ann@example.com"}
+        form.save(item_pk=returned.pk, current_user=user)
+
+        self.assertEqual(ValuableItemNotice.objects.count(), 3)
+        self.assertEqual(list(Job.objects.values_list("task", flat=True)), ["its.items.digest.send_valuable_digest"])
+        self.assertEqual(OutboxMessage.objects.count(), 0)
+
+        with patch("its.items.models.Item.found_on", side_effect=AssertionError), \
+                patch("its.items.models.Item.found_by", side_effect=AssertionError):
+            self.assertEqual(send_valuable_digest(), 3)
+
+        self.assertFalse(ValuableItemNotice.objects.exists())
+
+        drain_outbox()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Valuable items: 2 checked in, 1 returned")
+        self.assertEqual(mail.outbox[0].to, ["staff@example.com"])
+
+        for text in ["Blue laptop", "Gold ring", "Silver watch", "Returned to: Owner, Ann"]:
+            self.assertIn(text, mail.outbox[0].body)
+
+        self.assertEqual(send_valuable_digest(), 0)
+
+
+@override_settings(LDAP_POOL_SIZE=2, LDAP_POOL_WAIT=0.1, LDAP_HEALTH_CHECK_AFTER=60)
+class LDAPPoolTest(TestCase):
+
+    def make_connection(self, *args, **kwargs):
+        connection = Mock(closed=False, bound=True)
+        connection.response = [{'type': 'searchResEntry', 'dn': 'uid=test', 'attributes': {'uid': ['test']}}]
+        return connection
+
+    def test_reuse(self):
+
+        """
+        Check that searches share one bound connection.
+        """
+
+        with patch('its.ldap.ldap3.Server'), patch('its.ldap.ldap3.Connection', side_effect=self.make_connection) as connect:
+            pool = LDAPPool('default')
+
+            self.assertEqual(pool.search('(uid=test)'), [('uid=test', {'uid': ['test']})])
+            self.assertEqual(pool.search('(uid=test)'), [('uid=test', {'uid': ['test']})])
+            self.assertEqual(connect.call_count, 1)
+
+    def test_reconnect(self):
+
+        """
+        Check that a connection the server dropped is replaced, and the search made again.
+        """
+
+        with patch('its.ldap.ldap3.Server'), patch('its.ldap.ldap3.Connection', side_effect=self.make_connection) as connect:
+            pool = LDAPPool('default')
+            pool.search('(uid=test)')
+            dropped = pool.idle[0][0]
+            dropped.search.side_effect = LDAPSocketReceiveError('Connection reset')
+
+            self.assertEqual(pool.search('(uid=test)'), [('uid=test', {'uid': ['test']})])
+            self.assertEqual(connect.call_count, 2)
+            self.assertTrue(dropped.unbind.called)
+            self.assertEqual(len(pool.idle), 1)
+
+    def test_health_check(self):
+
+        """
+        Check that a connection idle for too long is only reused if it still answers.
+        """
+
+        with patch('its.ldap.ldap3.Server'), patch('its.ldap.ldap3.Connection', side_effect=self.make_connection) as connect:
+            pool = LDAPPool('default')
+            pool.search('(uid=test)')
+            stale = pool.idle[0][0]
+            pool.idle = [(stale, time.monotonic() - 120)]
+            stale.search.return_value = False
+
+            pool.search('(uid=test)')
+            self.assertEqual(connect.call_count, 2)
+            self.assertTrue(stale.unbind.called)
+
+    def test_max_size(self):
+
+        """
+        Check that no more than LDAP_POOL_SIZE connections are handed out at once.
+        """
+
+        with patch('its.ldap.ldap3.Server'), patch('its.ldap.ldap3.Connection', side_effect=self.make_connection):
+            pool = LDAPPool('default')
+            first = pool.acquire()
+            pool.acquire()
+
+            self.assertRaises(LDAPPoolTimeout, pool.acquire)
+
+            pool.release(first)
+            self.assertIs(pool.acquire(), first)
+
+
+# Helper function tests
+
+
+class checkLdapTest(TestCase):
+
+    def setUp(self):
+        known_usernames.clear()
+        unknown_usernames.clear()
+
+    def test_ldap_return_true(self):
+
+        """
+        Check that the correct value of True is returned for a username
+        that is in LDAP.
+        """
+
+        with patch('its.items.forms.ldapsearch', return_value=True):
+            user = check_ldap("test12345")
+            self.assertTrue(user)
+
+    def test_ldap_return_false(self):
+
+        """
+        Check that the correct value of False is returned for a username that
+        is not in LDAP.
+        """
+
+        with patch('its.items.forms.ldapsearch', return_value=False):
+            user = check_ldap("test12345")
+            self.assertFalse(user)
+
+    def test_ldap_exact_match(self):
+
+        """
+        Check that only an exact match is searched for, asking for a single
+        entry and no attributes, and that both answers are cached.
+        """
+
+        with patch('its.items.forms.ldapsearch', return_value=[('uid=abc', {})]) as ldapsearch:
+            self.assertTrue(check_ldap("ABC"))
+            self.assertTrue(check_ldap("abc"))
+
+        ldapsearch.assert_called_once_with('(uid=abc)', attributes=['1.1'], size_limit=1)
+
+        with patch('its.items.forms.ldapsearch', return_value=[]) as ldapsearch:
+            self.assertFalse(check_ldap("ab"))
+            self.assertFalse(check_ldap("ab"))
+
+        self.assertEqual(ldapsearch.call_count, 1)
+
+
+def ldap_person(uid):
+    return ('uid=%s' % uid, {'uid': [uid], 'givenName': [uid.title()], 'sn': ['Test'], 'mail': ['%s@pdx.edu' % uid]})
+
+
+class AutocompleteTest(TestCase):
+
+    def setUp(self):
+        autocomplete.cache.clear()
+
+    def test_get(self):
+
+        """
+        Tests that longer queries are answered from the cached results of a
+        shorter one, and that browsers may cache the response.
+        """
+
+        user = create_user()
+        self.client.login(username=user.username, password="password")
+        people = [ldap_person(uid) for uid in ["abcd", "abce", "abx"]]
+
+        with patch("its.items.autocomplete.ldapsearch", return_value=people) as ldapsearch:
+            with patch("its.items.autocomplete.parse_profile", side_effect=lambda attributes: attributes['uid'][0]):
+                response = self.client.get(reverse("users-autocomplete"), {"query": "ab"})
+                self.assertEqual(response.content.decode(), "[]")
+
+                response = self.client.get(reverse("users-autocomplete"), {"query": "abc"})
+                self.assertEqual(json.loads(response.content.decode()), ["abcd", "abce", "abx"])
+
+                response = self.client.get(reverse("users-autocomplete"), {"query": "ABCE"})
+                self.assertEqual(json.loads(response.content.decode()), ["abce"])
+
+        self.assertEqual(ldapsearch.call_count, 1)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+
+
+class PrefixCacheTest(unittest.TestCase):
+
+    def test_get(self):
+
+        """
+        Check that only complete entries answer longer queries, and that
+        entries expire and are evicted least recently used first.
+        """
+
+        cache = PrefixCache(max_size=2, ttl=60)
+        cache.set("abc", [("abcd", 1), ("abx", 2)], complete=True)
+        cache.set("xyz", [("xyza", 3)], complete=False)
+
+        self.assertEqual(cache.get("abc"), [("abcd", 1), ("abx", 2)])
+        self.assertEqual(cache.get("abcd"), [("abcd", 1)])
+        self.assertEqual(cache.get("xyz"), [("xyza", 3)])
+        self.assertIsNone(cache.get("xyza"))
+
+        # abc was used less recently than xyz
+        cache.set("def", [], complete=True)
+        self.assertIsNone(cache.get("abc"))
+        self.assertEqual(cache.get("defg"), [])
+
+        with patch("its.items.autocomplete.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("def"))
+
+
+@override_settings(USE_DIRECTORY_MIRROR=True)
+class DirectoryMirrorTest(TestCase):
+
+    def sync(self, people, **options):
+        pool = MagicMock(config={'search_dn': 'dc=pdx,dc=edu'})
+        ldap = pool.connection.return_value.__enter__.return_value
+        ldap.extend.standard.paged_search.return_value = [
+            {'type': 'searchResEntry', 'dn': 'uid=%s' % uid, 'attributes': {'uid': [uid], 'modifyTimestamp': [timestamp]}}
+            for uid, timestamp in people]
+
+        def profile(attributes):
+            return {'first_name': attributes['uid'][0].title(), 'last_name': 'Test', 'email': 'x@pdx.edu'}
+
+        with patch('its.users.management.commands.syncdirectory.get_pool', return_value=pool):
+            with patch('its.users.management.commands.syncdirectory.parse_profile', side_effect=profile):
+                call_command('syncdirectory', stdout=StringIO(), **options)
+
+        return ldap.extend.standard.paged_search.call_args[1]['search_filter']
+
+    def test_sync(self):
+
+        """
+        Check that a full sync copies everyone and removes people who left,
+        and that later syncs only ask for entries modified since.
+        """
+
+        make(DirectoryEntry, uid="gone", synced_on=timezone.now() - timedelta(days=1))
+
+        query = self.sync([("Abcd", "20150312184500Z"), ("abx", "20150101000000Z")], full=True)
+        self.assertEqual(query, "(uid=*)")
+        self.assertEqual(list(DirectoryEntry.objects.values_list("uid", flat=True)), ["abcd", "abx"])
+        self.assertEqual(DirectoryEntry.objects.get(uid="abcd").first_name, "Abcd")
+
+        query = self.sync([("abx", "20150401000000Z")])
+        self.assertEqual(query, "(&(uid=*)(modifyTimestamp>=20150312184500Z))")
+        self.assertEqual(DirectoryEntry.objects.count(), 2)
+        self.assertEqual(DirectoryEntry.objects.get(uid="abx").modified_on.year, 2015)
+        self.assertEqual(DirectoryEntry.objects.get(uid="abx").modified_on.month, 4)
+
+    def test_lookups(self):
+
+        """
+        Check that the autocomplete and username check use the local copy instead of LDAP.
+        """
+
+        known_usernames.clear()
+        unknown_usernames.clear()
+
+        for uid in ["abx", "abcd", "zed"]:
+            make(DirectoryEntry, uid=uid, first_name=uid, last_name="Test", synced_on=timezone.now())
+
+        with patch("its.items.autocomplete.ldapsearch") as ldapsearch, patch("its.items.forms.ldapsearch") as check:
+            self.assertEqual([uid for uid, profile in autocomplete.search_people("AB", 10)], ["abcd", "abx"])
+            self.assertEqual(autocomplete.search_people("zed", 10)[0][1]["full_name"], "zed Test")
+            self.assertTrue(check_ldap("abcd"))
+            self.assertFalse(check_ldap("abc"))
+
+        self.assertFalse(ldapsearch.called)
+        self.assertFalse(check.called)
+
+
+class CreateUserTest(TestCase):
+
+    def test_suffixes_count_up(self):
+
+        """
+        Check that people with the same name get consecutive usernames.
+        """
+
+        self.assertEqual(forms.create_user("John", "Smith", "a@example.com").username, "_JohnSmith0")
+        self.assertEqual(forms.create_user("John", "Smith", "b@example.com").username, "_JohnSmith1")
+        self.assertFalse(User.objects.get(username="_JohnSmith1").is_active)
+
+    def test_skips_taken_username(self):
+
+        """
+        Check that a username that was taken before the counter knew about
+        it is skipped.
+        """
+
+        make(User, username="_JaneDoe0")
+        make(User, username="_JaneDoe1")
+
+        self.assertEqual(forms.create_user("Jane", "Doe", "jane@example.com").username, "_JaneDoe2")
+        self.assertEqual(forms.create_user("Jane", "Doe", "jane2@example.com").username, "_JaneDoe3")
+
+    def test_get_or_create_owner(self):
+
+        """
+        Check that an owner is found by their email and name regardless of
+        case, and only created once.
+        """
+
+        owner = forms.get_or_create_owner("Jane", "Doe", "Jane.Doe@example.com")
+        self.assertFalse(owner.is_active)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(forms.get_or_create_owner(" jane", "DOE", "jane.doe@example.com").pk, owner.pk)
+
+        self.assertNotEqual(forms.get_or_create_owner("Jane", "Doe", "other@example.com").pk, owner.pk)
+
+    def test_create_user_existing_owner(self):
+
+        """
+        Check that when another request recorded the same owner first, that
+        owner is returned rather than a second one being created.
+        """
+
+        owner = create_full_user("Jane", "Doe", "jane@example.com")
+
+        self.assertEqual(forms.create_user("Jane", "Doe", "jane@example.com").pk, owner.pk)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 1)
+
+
+class BulkCheckInTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def setUp(self):
+        self.user = create_user()
+        self.client.login(username=self.user.username, password="password")
+        self.location = make(Location)
+        self.category = make(Category)
+
+    def post(self, entries):
+        return self.client.post(reverse("bulk-checkin"), json.dumps(entries), content_type="application/json")
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.post([])
+        self.assertEqual(response.status_code, 302)
+
+    def test_checkin(self):
+
+        """
+        Check that every item is checked in with its status, owner and emails.
+        """
+
+        entries = [
+            {'location': self.location.pk, 'category': self.category.pk, 'description': "Blue hat", 'is_valuable': False},
+            {'location': self.location.pk, 'category': self.category.pk, 'description': "Wallet", 'is_valuable': True,
+             'possible_owner_found': True, 'first_name': "Jane", 'last_name': "Doe", 'email': "jane@example.com"},
+            {'location': self.location.pk, 'category': self.category.pk, 'description': "Keys", 'is_valuable': False,
+             'possible_owner_found': True, 'first_name': "jane", 'last_name': "doe", 'email': "JANE@example.com"},
+        ]
+
+        response = self.post(entries)
+        self.assertEqual(response.status_code, 201)
+
+        ids = [row['id'] for row in json.loads(response.content.decode())['items']]
+        items = list(Item.objects.with_status_summary().filter(pk__in=ids).order_by("pk"))
+
+        self.assertEqual([item.description for item in items], ["Blue hat", "Wallet", "Keys"])
+        self.assertEqual(ids, sorted(ids))
+
+        for item in items:
+            self.assertEqual(item.current_status.action_taken.machine_name, Action.CHECKED_IN)
+            self.assertEqual(item.finder, self.user)
+            self.assertIsNotNone(item.date_found)
+            self.assertEqual(LastStatus.objects.get(item=item).machine_name, Action.CHECKED_IN)
+
+        self.assertIsNone(items[0].possible_owner)
+        self.assertEqual(items[1].possible_owner, items[2].possible_owner)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 1)
+
+        subjects = sorted(message.subject for message in mail.outbox)
+        self.assertEqual(subjects, ['An item belonging to you was found'] * 2 + ['Valuable item checked in'])
+
+    def test_invalid(self):
+
+        """
+        Check that nothing is checked in when any item is invalid, and that
+        the errors line up with the items.
+        """
+
+        entries = [
+            {'location': self.location.pk, 'category': self.category.pk, 'description': "Blue hat"},
+            {'location': self.location.pk, 'category': self.category.pk, 'description': "Wallet", 'possible_owner_found': True},
+        ]
+
+        response = self.post(entries)
+        self.assertEqual(response.status_code, 400)
+
+        errors = json.loads(response.content.decode())['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('email', errors[1])
+        self.assertFalse(Item.objects.exists())
+
+        self.assertEqual(self.post({'description': "Not a list"}).status_code, 400)
+
+        with override_settings(BULK_CHECKIN_MAX_ITEMS=1):
+            self.assertEqual(self.post(entries).status_code, 400)
+
+
+class BulkActionFormTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def test_save(self):
+
+        """
+        Check that the action is taken on the selected items that match the
+        filter, with one status each, and that checking items back in
+        clears who they were returned to.
+        """
+
+        user = create_staff()
+        owner = create_full_user("Jane", "Doe", "jane@example.com")
+        items = [make(Item, returned_to=owner, is_archived=False) for i in range(3)]
+        archived = make(Item, returned_to=owner, is_archived=True)
+        checked_in = Action.objects.get(machine_name=Action.CHECKED_IN)
+
+        form = BulkActionForm({
+            'action_choice': checked_in.pk,
+            'note': "Back from CPSO",
+            'selected_ids': [items[0].pk, items[1].pk, archived.pk],
+        }, item_list=Item.objects.filter(is_archived=False))
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save(current_user=user), 2)
+
+        for item in Item.objects.with_status_summary().filter(pk__in=[items[0].pk, items[1].pk]):
+            self.assertEqual(item.current_status.action_taken, checked_in)
+            self.assertEqual(item.current_status.note, "Back from CPSO")
+            self.assertEqual(item.current_status.performed_by, user)
+            self.assertIsNone(item.returned_to)
+
+        self.assertEqual(Status.objects.count(), 2)
+        self.assertEqual(LastStatus.objects.filter(machine_name=Action.CHECKED_IN).count(), 2)
+        self.assertEqual(Item.objects.get(pk=items[2].pk).returned_to, owner)
+        self.assertEqual(Item.objects.get(pk=archived.pk).returned_to, owner)
+
+    def test_apply_to_all(self):
+
+        """
+        Check that every item matching the filter can be changed at once.
+        """
+
+        user = create_staff()
+        make(Item, is_archived=False, _quantity=3)
+        disposed = Action.objects.get(machine_name=Action.DISPOSED)
+
+        form = BulkActionForm({'action_choice': disposed.pk, 'apply_to_all': True}, item_list=Item.objects.all())
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save(current_user=user), 3)
+        self.assertEqual(LastStatus.objects.filter(machine_name=Action.DISPOSED).count(), 3)
+
+    def test_invalid(self):
+
+        """
+        Check that items can't be returned in bulk, and that some items
+        have to be chosen.
+        """
+
+        returned = Action.objects.get(machine_name=Action.RETURNED)
+        disposed = Action.objects.get(machine_name=Action.DISPOSED)
+
+        form = BulkActionForm({'action_choice': returned.pk, 'selected_ids': [1]}, item_list=Item.objects.all())
+        self.assertFalse(form.is_valid())
+        self.assertIn('action_choice', form.errors)
+
+        form = BulkActionForm({'action_choice': disposed.pk}, item_list=Item.objects.all())
+        self.assertFalse(form.is_valid())
+
+
+@override_settings(RETENTION_POLICIES=[
+    {'category': 'USB', 'days': 30, 'action': 'DISPOSED'},
+    {'category': None, 'days': 180, 'action': None},
+])
+class ApplyRetentionTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def setUp(self):
+        self.usb = make(Category, machine_name=Category.USB)
+        self.other = make(Category, machine_name=Category.OTHER)
+
+    def item(self, category, days, action=Action.CHECKED_IN):
+        item = make(Item, category=category, is_archived=False)
+        Status(item=item, action_taken=Action.objects.get(machine_name=action), note="").save()
+        Item.objects.filter(pk=item.pk).update(date_found=timezone.now() - timedelta(days=days))
+        return item
+
+    def test_apply(self):
+
+        """
+        Check that each policy changes only the items it applies to, a chunk at a time.
+        """
+
+        old_usb = [self.item(self.usb, 40) for i in range(3)]
+        new_usb = self.item(self.usb, 10)
+        returned_usb = self.item(self.usb, 40, Action.RETURNED)
+        old_other = self.item(self.other, 40)
+        ancient = self.item(self.other, 200, Action.RETURNED)
+
+        call_command("apply_retention", chunk_size=2, stdout=StringIO())
+
+        disposed = LastStatus.objects.filter(machine_name=Action.DISPOSED).values_list("item_id", flat=True)
+        self.assertEqual(sorted(disposed), sorted(item.pk for item in old_usb))
+        self.assertEqual(Status.objects.filter(action_taken__machine_name=Action.DISPOSED).count(), 3)
+        self.assertEqual(list(ArchivedItem.objects.values_list("pk", flat=True)), [ancient.pk])
+
+        for item in [new_usb, returned_usb, old_other]:
+            self.assertEqual(Status.objects.filter(item=item).count(), 1)
+
+    def test_dry_run(self):
+
+        """
+        Check that a dry run reports what would change without changing it.
+        """
+
+        self.item(self.usb, 40)
+        self.item(self.other, 200)
+        stdout = StringIO()
+
+        call_command("apply_retention", dry_run=True, stdout=stdout)
+
+        self.assertIn("USB after 30 days becomes DISPOSED: 1 items would change", stdout.getvalue())
+        self.assertIn("Every category after 180 days becomes ARCHIVED: 1 items would change", stdout.getvalue())
+        self.assertFalse(LastStatus.objects.filter(machine_name=Action.DISPOSED).exists())
+        self.assertFalse(ArchivedItem.objects.exists())
+
+
+class ArchiveTablesTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def test_round_trip(self):
+
+        """
+        Check that archiving moves an item and its statuses into the archive
+        tables, and unarchiving brings them back as they were.
+        """
+
+        user = create_user()
+        item = make(Item, is_archived=False, description="Blue hydro flask")
+        Status(item=item, action_taken=Action.objects.get(machine_name=Action.CHECKED_IN), note="", performed_by=user).save()
+        Status(item=item, action_taken=Action.objects.get(machine_name=Action.DISPOSED), note="Gone", performed_by=user).save()
+        item = Item.objects.get(pk=item.pk)
+
+        archive_items([item.pk], [])
+
+        self.assertFalse(Item.objects.filter(pk=item.pk).exists())
+        self.assertFalse(Status.objects.filter(item_id=item.pk).exists())
+        self.assertFalse(LastStatus.objects.filter(item_id=item.pk).exists())
+
+        archived = ArchivedItem.objects.with_status_summary().get(pk=item.pk)
+        self.assertEqual(archived.current_status.note, "Gone")
+        self.assertEqual(archived.finder, user)
+        self.assertEqual(ArchivedStatus.objects.filter(item=archived).count(), 2)
+        self.assertEqual(list(ArchivedItem.objects.search("hydro")), [archived])
+
+        archive_items([], [item.pk])
+
+        restored = Item.objects.get(pk=item.pk)
+        self.assertFalse(ArchivedItem.objects.exists())
+        self.assertFalse(ArchivedStatus.objects.exists())
+        self.assertEqual(restored.current_status_id, item.current_status_id)
+        self.assertEqual(restored.date_found, item.date_found)
+        self.assertEqual(Status.objects.filter(item=restored).count(), 2)
+        self.assertEqual(LastStatus.objects.get(item=restored).machine_name, Action.DISPOSED)
+
+    def waiting_for_digest(self):
+        item = make(Item, is_archived=False, is_valuable=True)
+        status = Status(item=item, action_taken=Action.objects.get(machine_name=Action.CHECKED_IN), note="")
+        status.save()
+        ValuableItemNotice.objects.create(status=status)
+        return item
+
+    def test_pending_digest(self):
+
+        """
+        Check that an item waiting for the valuable item digest is only
+        marked as archived, and moved once the digest has gone out.
+        """
+
+        item = self.waiting_for_digest()
+        other = make(Item, is_archived=False)
+
+        self.assertEqual(archive_items([item.pk, other.pk], []), {"archived": 1, "restored": 0, "skipped": 1})
+
+        self.assertTrue(Item.objects.get(pk=item.pk).is_archived)
+        self.assertEqual(list(ArchivedItem.objects.values_list("pk", flat=True)), [other.pk])
+
+        self.assertEqual(send_valuable_digest(), 1)
+
+        self.assertFalse(Item.objects.filter(pk=item.pk).exists())
+        self.assertEqual(sorted(ArchivedItem.objects.values_list("pk", flat=True)), sorted([item.pk, other.pk]))
+
+    def test_pending_digest_message(self):
+
+        """
+        Check that the admin item list says when items are held back for the
+        valuable item digest.
+        """
+
+        item = self.waiting_for_digest()
+        user = create_staff()
+        self.client.login(username=user.username, password="password")
+        data = {'archived_ids': [str(item.pk)], 'changed_ids': str(item.pk)}
+
+        response = self.client.post(reverse("admin-itemlist"), data, follow=True)
+        self.assertContains(response, "0 items archived, 0 unarchived")
+        self.assertContains(response, "1 items were not changed yet")
+
+    def test_printoff(self):
+
+        """
+        Check that the print off page still shows an archived item.
+        """
+
+        user = create_user()
+        self.client.login(username=user.username, password="password")
+        item = make(Item, is_archived=False, description="Blue hydro flask")
+        archive_items([item.pk], [])
+
+        response = self.client.get(reverse("printoff", args=[item.pk]))
+        self.assertContains(response, "Blue hydro flask")
+
+
+@override_settings(ROLLUP_SETTLE_TIME=0)
+class RollupStatsTest(TestCase):
+
+    fixtures = ["actions.json"]
+
+    def setUp(self):
+        self.checked_in = Action.objects.get(machine_name=Action.CHECKED_IN)
+        self.disposed = Action.objects.get(machine_name=Action.DISPOSED)
+        self.today = timezone.localtime(timezone.now()).date()
+        self.category = make(Category)
+
+    def add_item(self, location, is_valuable=False):
+        item = make(Item, is_archived=False, is_valuable=is_valuable, location=location, category=self.category)
+        Status(item=item, action_taken=self.checked_in, note="").save()
+        return item
+
+    def test_rollup(self):
+
+        """
+        Check that new statuses are counted once, including the archived
+        ones, and that the reports read the totals back.
+        """
+
+        location = make(Location, name="Library")
+        first = self.add_item(location, is_valuable=True)
+        self.add_item(location)
+        Status(item=first, action_taken=self.disposed, note="").save()
+        archive_items([first.pk], [])
+
+        self.assertIsNotNone(rollup_daily_stats())
+        self.assertIsNone(rollup_daily_stats())
+
+        found = found_by_place(self.today, self.today)
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0]["location__name"], "Library")
+        self.assertEqual(found[0]["found"], 2)
+        self.assertEqual(found[0]["valuable"], 1)
+        self.assertEqual(outcomes(self.today, self.today), [{"action__name": self.disposed.name, "total": 1, "share": 100.0}])
+        self.assertEqual(monthly_volume(self.today, self.today)[0]["found"], 2)
+
+        self.add_item(location)
+        rollup_daily_stats()
+        self.assertEqual(found_by_place(self.today, self.today)[0]["found"], 3)
+        self.assertEqual(DailyItemStats.objects.filter(action=self.checked_in).count(), 1)
+
+    def test_rebuild(self):
+
+        """
+        Check that --rebuild counts everything again from scratch.
+        """
+
+        self.add_item(make(Location))
+        call_command("rollup_stats", stdout=StringIO())
+        DailyItemStats.objects.update(count=10)
+
+        call_command("rollup_stats", rebuild=True, stdout=StringIO())
+        self.assertEqual(DailyItemStats.objects.get().count, 1)
+
+    @override_settings(ROLLUP_SETTLE_TIME=3600)
+    def test_settle_time(self):
+
+        """
+        Check that statuses newer than the settle time are left for the next run.
+        """
+
+        self.add_item(make(Location))
+        self.assertIsNone(rollup_daily_stats())
+        self.assertFalse(DailyItemStats.objects.exists())
+
+    def test_view(self):
+
+        """
+        Check that the reports page is only for staff, and shows the rollup.
+        """
+
+        response = self.client.get(reverse("reports"))
+        self.assertEqual(response.status_code, 302)
+
+        self.add_item(make(Location, name="Library"))
+        rollup_daily_stats()
+
+        user = create_staff()
+        self.client.login(username=user.username, password="password")
+        response = self.client.get(reverse("reports"), {"start": str(self.today), "end": str(self.today)})
+        self.assertContains(response, "Library")
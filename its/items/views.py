@@ -1,12 +1,20 @@
+import json
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
-from its.items.models import Item, Status
-from its.items.forms import CheckInForm, ItemFilterForm, ItemArchiveForm, AdminItemFilterForm, AdminActionForm
+from its.items.models import Item, ArchivedItem, Status, ArchivedStatus, Action
+from its.items.forms import CheckInForm, ItemFilterForm, ItemArchiveForm, AdminItemFilterForm, AdminActionForm, BulkActionForm
+from its.items.forms import CheckInItemForm, ReportForm, check_in_items
+from its.items.pagination import paginate
 from django.core.urlresolvers import reverse
-from arcutils.ldap import escape, ldapsearch, parse_profile
+from its.items.autocomplete import search_people
+from its.items import reports as item_reports
+from arcutils.ldap import escape
+from django.utils.cache import patch_cache_control
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
+from django.views.decorators.http import require_POST
 
 
 def staff_check(user):
@@ -28,27 +36,68 @@ def admin_itemlist(request):
     # Built item list from filter.
     item_filter_form = AdminItemFilterForm(request.GET if "action" in request.GET else None)
     item_list = item_filter_form.filter()
+    page = paginate(request, item_list, item_filter_form.ordering(), settings.ITEM_LIST_PAGE_SIZE)
+
+    item_archive_form = ItemArchiveForm(item_list=page.object_list)
+    bulk_action_form = BulkActionForm(item_list=item_list)
+
+    # Process bulk action request
+    if request.method == 'POST' and request.POST.get('action') == "Take action":
+
+        bulk_action_form = BulkActionForm(request.POST, item_list=item_list)
+
+        if bulk_action_form.is_valid():
+            count = bulk_action_form.save(current_user=request.user)
+            messages.success(request, "%d items changed" % count)
+            return HttpResponseRedirect(request.get_full_path())
 
     # Process archive request
-    if request.method == 'POST':
+    elif request.method == 'POST':
 
-        item_archive_form = ItemArchiveForm(request.POST, item_list=item_list)
+        item_archive_form = ItemArchiveForm(request.POST, item_list=page.object_list)
 
         if item_archive_form.is_valid():
             item_archive_form.save()
-            messages.success(request, "Item successfully changed")
-            return HttpResponseRedirect(request.get_full_path())
+            counts = item_archive_form.counts
+            messages.success(request, "%(archived)d items archived, %(restored)d unarchived" % counts)
 
-    else:
-        item_archive_form = ItemArchiveForm(item_list=item_list)
+            if counts["skipped"]:
+                messages.warning(request, "%d items were not changed yet. Valuable items are archived once the "
+                                          "staff digest about them has gone out." % counts["skipped"])
+
+            return HttpResponseRedirect(request.get_full_path())
 
     return render(request, 'items/admin-itemlist.html', {
-        'items': item_list,
+        'items': page.object_list,
+        'page': page,
         'item_filter': item_filter_form,
         'archive_form': item_archive_form,
+        'action_form': bulk_action_form,
         })
 
 
+@user_passes_test(staff_check)
+def reports(request):
+
+    """
+    Reporting page for staff, with the items found per location and category,
+    what happened to them and the valuable items found each month. The
+    figures come from the daily_item_stats rollup.
+    """
+
+    form = ReportForm(request.GET or None)
+    start, end = form.period()
+
+    return render(request, 'items/reports.html', {
+        'form': form,
+        'start': start,
+        'end': end,
+        'found': item_reports.found_by_place(start, end),
+        'outcomes': item_reports.outcomes(start, end),
+        'months': item_reports.monthly_volume(start, end),
+    })
+
+
 @login_required
 def adminaction(request, item_num):
 
@@ -57,9 +106,15 @@ def adminaction(request, item_num):
     Allows user to change status of items.
     """
 
-    chosen_item = get_object_or_404(Item, pk=item_num)
+    chosen_item = Item.objects.with_status_summary().filter(pk=item_num).first()
     status_list = Status.objects.filter(item=item_num)
 
+    if chosen_item is None:
+        chosen_item = get_object_or_404(ArchivedItem.objects.with_status_summary(), pk=item_num)
+        status_list = ArchivedStatus.objects.filter(item=item_num)
+
+    status_list = status_list.select_related("action_taken", "performed_by")
+
     # Perform action on item
     if request.method == 'POST':
 
@@ -91,9 +146,11 @@ def itemlist(request):
     # Create and filter item list
     item_filter_form = ItemFilterForm(request.GET if "action" in request.GET else None)
     item_list = item_filter_form.filter()
+    page = paginate(request, item_list, item_filter_form.ordering(), settings.ITEM_LIST_PAGE_SIZE)
 
     return render(request, 'items/itemlist.html', {
-        'items': item_list,
+        'items': page.object_list,
+        'page': page,
         'item_filter': item_filter_form,
         })
 
@@ -119,6 +176,39 @@ def checkin(request):
     return render(request, 'items/checkin.html', {'form': form})
 
 
+@login_required
+@require_POST
+def bulk_checkin(request):
+
+    """
+    Checks in a JSON array of items at once. Each object has the fields of
+    the check in form. Either every item is checked in, or none are and the
+    errors for each item are returned.
+    """
+
+    try:
+        entries = json.loads(request.body.decode())
+    except ValueError:
+        return JsonResponse({'error': 'The request body is not valid JSON.'}, status=400)
+
+    if not isinstance(entries, list) or not entries or not all(isinstance(entry, dict) for entry in entries):
+        return JsonResponse({'error': 'Expected a list of items.'}, status=400)
+
+    if len(entries) > settings.BULK_CHECKIN_MAX_ITEMS:
+        return JsonResponse({'error': 'At most %d items can be checked in at once.' % settings.BULK_CHECKIN_MAX_ITEMS}, status=400)
+
+    item_forms = [CheckInItemForm(entry) for entry in entries]
+
+    if not all([form.is_valid() for form in item_forms]):
+        return JsonResponse({'errors': [form.errors for form in item_forms]}, status=400)
+
+    items = check_in_items([form.cleaned_data for form in item_forms], current_user=request.user)
+
+    return JsonResponse({'items': [
+        {'id': item.pk, 'printoff': reverse("printoff", args=[item.pk])} for item in items
+    ]}, status=201)
+
+
 @login_required
 def autocomplete(request):
 
@@ -126,20 +216,56 @@ def autocomplete(request):
     Does an LDAP search and returns a JSON array of objects
     """
 
-    q = escape(request.GET['query'])
-    if len(q) < 3:
-        return HttpResponse("[]")
+    q = request.GET['query']
+    if len(escape(q)) < 3:
+        response = HttpResponse("[]")
+
+    else:
+        # only return a handful of results
+        MAX_RESULTS = 10
+        output = [profile for username, profile in search_people(q, MAX_RESULTS)]
+        response = JsonResponse(output, safe=False)
+
+    # Let the browser reuse the answer when the user backspaces and retypes
+    patch_cache_control(response, private=True, max_age=settings.AUTOCOMPLETE_MAX_AGE)
+    return response
+
+
+@login_required
+def item_search(request):
+
+    """
+    Returns a JSON array of the active items that best match the query,
+    for the type-ahead box on the item lists. Like the lab attendant item
+    list, only checked in items are returned for it (the checked_in
+    parameter) and for anyone who isn't staff.
+    """
+
+    q = request.GET.get('query', '').strip()
+    if len(q) < 2:
+        return JsonResponse([], safe=False)
 
-    search = '(uid={q}*)'.format(q=q)
-    results = ldapsearch(search)
-    # I don't think LDAP guarantees the sort order, so we have to sort ourselves
-    results.sort(key=lambda o: o[1]['uid'][0])
-    output = []
     # only return a handful of results
     MAX_RESULTS = 10
 
+    items = Item.objects.filter(is_archived=False)
+
+    if request.GET.get('checked_in') or not request.user.is_staff:
+        items = items.filter(laststatus__machine_name=Action.CHECKED_IN)
+
+    results = items.quick_search(q).order_by('-similarity', '-item_id').values(
+        'item_id', 'description', 'location__name', 'category__name', 'current_status__action_taken__name', 'similarity')
+
+    output = []
+
     for result in results[:MAX_RESULTS]:
-        output.append(parse_profile(result[1]))
+        output.append({
+            'id': result['item_id'],
+            'description': result['description'],
+            'location': result['location__name'],
+            'category': result['category__name'],
+            'status': result['current_status__action_taken__name'],
+        })
 
     return JsonResponse(output, safe=False)
 
@@ -155,5 +281,9 @@ def printoff(request, item_id):
     if request.method == 'POST' and request.POST['action'] == "Return to item check-in":
         return HttpResponseRedirect(reverse("checkin"))
 
-    item = get_object_or_404(Item, pk=item_id)
+    item = Item.objects.with_status_summary().filter(pk=item_id).first()
+
+    if item is None:
+        item = get_object_or_404(ArchivedItem.objects.with_status_summary(), pk=item_id)
+
     return render(request, 'items/printoff.html', {'item': item})
@@ -0,0 +1,34 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from its.jobs.outbox import drain_outbox, outbox_metrics, requeue_dead
+
+
+class Command(BaseCommand):
+    help = 'Shows how far behind the email outbox is, and optionally sends or retries its messages.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--drain', action='store_true', default=False,
+                    help='Send the messages that are due now instead of waiting for the worker.'),
+        make_option('--requeue-dead', action='store_true', default=False,
+                    help='Try the messages that were given up on again.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write('Requeued %d dead messages' % requeue_dead())
+
+        if options['drain']:
+            stats = drain_outbox()
+            self.stdout.write('Sent %(sent)d messages (%(per_second).1f/s), %(retried)d to retry, %(dead)d dead' % stats)
+
+        metrics = outbox_metrics()
+        self.stdout.write('Pending: %d' % metrics['pending'])
+        self.stdout.write('Dead: %d' % metrics['dead'])
+
+        if metrics['oldest_pending'] is not None:
+            self.stdout.write('Oldest pending message waiting for: %.0fs' % metrics['oldest_pending'])
+
+        self.stdout.write('Sent in the last hour: %d' % metrics['sent_last_hour'])
+
+        if metrics['average_lag'] is not None:
+            self.stdout.write('Average wait before sending: %.1fs' % metrics['average_lag'])
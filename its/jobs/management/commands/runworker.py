@@ -0,0 +1,67 @@
+import signal
+import threading
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from its.jobs.models import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs the jobs in the job queue until it is stopped.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency', type='int', default=1,
+                    help='Number of jobs to run at the same time.'),
+        make_option('--burst', action='store_true', default=False,
+                    help='Stop once there are no more jobs due, instead of waiting for new ones.'),
+    )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        self.burst = options['burst']
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+
+        threads = [threading.Thread(target=self.work, name='worker-%d' % i) for i in range(options['concurrency'])]
+
+        for thread in threads:
+            thread.start()
+
+        self.stdout.write('Started %d worker thread(s)' % len(threads))
+
+        # Join with a timeout so the main thread keeps handling signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1)
+
+    def stop(self):
+        self.stdout.write('Stopping after the running jobs finish...')
+        self.stopping.set()
+
+    def work(self):
+
+        """
+        Claim and run jobs until told to stop. Each thread has its own
+        database connection, which is closed when the thread finishes.
+        """
+
+        try:
+            while not self.stopping.is_set():
+                job = claim_job()
+
+                if job is None:
+                    if self.burst:
+                        break
+
+                    self.stopping.wait(settings.JOBS_POLL_INTERVAL)
+                    continue
+
+                if run_job(job):
+                    self.stdout.write('Ran job %d (%s)' % (job.pk, job.task))
+                else:
+                    self.stdout.write('Job %d (%s) failed: %s' % (job.pk, job.task, job.status))
+
+        finally:
+            connection.close()
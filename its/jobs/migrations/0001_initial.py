@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False)),
+                ('task', models.CharField(max_length=255)),
+                ('args', models.TextField(default='[]')),
+                ('status', models.CharField(max_length=10, choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued')),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=5)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'job',
+                'ordering': ['-pk'],
+            },
+            bases=(models.Model,),
+        ),
+        # The workers only ever look for unfinished jobs, which are a tiny
+        # part of the table once it has been running for a while.
+        migrations.RunSQL(
+            "CREATE INDEX job_pending_idx ON job (run_at, job_id) WHERE status IN ('queued', 'running')",
+            reverse_sql="DROP INDEX job_pending_idx",
+        ),
+    ]
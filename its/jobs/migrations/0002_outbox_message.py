@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('message_id', models.AutoField(primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(max_length=255)),
+                ('to', models.TextField()),
+                ('status', models.CharField(max_length=10, choices=[('pending', 'Pending'), ('sent', 'Sent'), ('dead', 'Dead')], default='pending')),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_on', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'outbox_message',
+                'ordering': ['pk'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX outbox_message_pending_idx ON outbox_message (message_id) WHERE status = 'pending'",
+            reverse_sql="DROP INDEX outbox_message_pending_idx",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX outbox_message_sent_on_idx ON outbox_message (sent_on) WHERE status = 'sent'",
+            reverse_sql="DROP INDEX outbox_message_sent_on_idx",
+        ),
+    ]
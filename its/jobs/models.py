@@ -0,0 +1,231 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class Job(models.Model):
+    # A call to a module level function, stored so a worker process
+    # (manage.py runworker) can make it outside of the request.
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    status_choices = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    job_id = models.AutoField(primary_key=True)
+    task = models.CharField(max_length=255)
+    args = models.TextField(default="[]")
+    status = models.CharField(max_length=10, choices=status_choices, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "job"
+        ordering = ['-pk']
+
+    def __str__(self):
+        return "%s %s" % (self.task, self.args)
+
+    def func(self):
+        return import_string(self.task)
+
+
+class OutboxMessage(models.Model):
+    # An email waiting to be sent. Rows are written in the same transaction
+    # as the change they are about, and sent in batches by drain_outbox().
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"
+
+    status_choices = (
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (DEAD, "Dead"),
+    )
+
+    message_id = models.AutoField(primary_key=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.TextField()
+    status = models.CharField(max_length=10, choices=status_choices, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_on = models.DateTimeField(default=timezone.now)
+    sent_on = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "outbox_message"
+        ordering = ['pk']
+
+    def __str__(self):
+        return self.subject
+
+
+def task_name(func):
+    return "%s.%s" % (func.__module__, func.__name__)
+
+
+def enqueue(func, *args, delay=None):
+
+    """
+    Run func(*args) on a worker. The arguments must be JSON serializable, so
+    pass primary keys rather than model instances.
+
+    The job row is written in the current transaction, so a worker only sees
+    it once whatever the job refers to has been committed. With
+    JOBS_ALWAYS_EAGER set (as it is for the tests) func is called right away.
+    """
+
+    if settings.JOBS_ALWAYS_EAGER:
+        func(*args)
+        return None
+
+    run_at = timezone.now() + (delay or timedelta())
+
+    return Job.objects.create(
+        task=task_name(func),
+        args=json.dumps(args),
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+        run_at=run_at,
+    )
+
+
+def enqueue_once(func, delay=None):
+
+    """
+    Queue func() to run after delay, unless a call to it is already queued
+    to run by then.
+
+    The queued job that is reused stays locked until the current transaction
+    ends, and claim_job() skips locked jobs, so it can't run before whatever
+    this call was made for has been committed. A queued job that is already
+    locked, by a worker claiming it or by another transaction, isn't reused.
+    """
+
+    run_at = timezone.now() + (delay or timedelta())
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT job_id FROM job
+            WHERE task = %s AND status = %s AND run_at <= %s
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, [task_name(func), Job.QUEUED, run_at])
+        queued = cursor.fetchone()
+
+    if queued is None:
+        enqueue(func, delay=delay)
+
+
+def retry_delay(attempts):
+
+    """
+    How long to wait before running a job again after its attempts-th failure.
+    """
+
+    return timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_job():
+
+    """
+    Lock the next job that is due and mark it as running. Jobs that have been
+    running for longer than JOBS_LOCK_TIMEOUT belonged to a worker that died,
+    and are picked up again. Rows locked by other workers are skipped, so any
+    number of workers can claim jobs at the same time without waiting on each
+    other. Returns None when there is nothing to do.
+    """
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE job SET status = %s, locked_at = %s, attempts = attempts + 1
+                WHERE job_id = (
+                    SELECT job_id FROM job
+                    WHERE (status = %s AND run_at <= %s) OR (status = %s AND locked_at < %s)
+                    ORDER BY run_at, job_id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING job_id
+            """, [Job.RUNNING, now, Job.QUEUED, now, Job.RUNNING, now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)])
+            row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    return Job.objects.get(pk=row[0])
+
+
+def run_job(job):
+
+    """
+    Call the job's function. A job that raises is queued again after
+    retry_delay(), until it has used up its attempts and is marked as failed.
+    """
+
+    try:
+        job.func()(*json.loads(job.args))
+
+    except Exception:
+        job.last_error = traceback.format_exc()
+
+        if job.attempts >= job.max_attempts:
+            logger.exception("Job %d (%s) failed for good after %d attempts", job.pk, job.task, job.attempts)
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+
+        else:
+            logger.warning("Job %d (%s) failed, trying again later", job.pk, job.task, exc_info=True)
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+
+        job.locked_at = None
+        job.save(update_fields=["status", "run_at", "locked_at", "finished_at", "last_error"])
+        return False
+
+    job.status = Job.DONE
+    job.locked_at = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "locked_at", "finished_at"])
+    return True
+
+
+def run_pending():
+
+    """
+    Run every job that is due, one after the other. Returns how many were run.
+    """
+
+    count = 0
+    job = claim_job()
+
+    while job is not None:
+        run_job(job)
+        count += 1
+        job = claim_job()
+
+    return count
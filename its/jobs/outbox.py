@@ -0,0 +1,205 @@
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from its.jobs.models import OutboxMessage, enqueue_once
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(*messages):
+
+    """
+    Store EmailMessages in the outbox, in the current transaction, and make
+    sure a worker drains it. Nothing is sent if the transaction rolls back.
+    """
+
+    now = timezone.now()
+
+    OutboxMessage.objects.bulk_create([
+        OutboxMessage(subject=message.subject, body=message.body, from_email=message.from_email,
+                      to=json.dumps(message.to), created_on=now, next_attempt_at=now)
+        for message in messages
+    ])
+
+    schedule_drain()
+
+
+def schedule_drain(delay=None):
+
+    """
+    Queue a drain_outbox() job, unless one is already queued to run by then.
+    """
+
+    enqueue_once(drain_outbox, delay=delay)
+
+
+def retry_delay(attempts):
+
+    """
+    How long to wait before trying a message again after its attempts-th failure.
+    """
+
+    return timedelta(seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch():
+
+    """
+    Lock up to OUTBOX_BATCH_SIZE messages that are due. Messages locked by
+    another drain are skipped. Must be called in a transaction.
+    """
+
+    return list(OutboxMessage.objects.raw("""
+        SELECT * FROM outbox_message
+        WHERE status = %s AND next_attempt_at <= %s
+        ORDER BY message_id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, [OutboxMessage.PENDING, timezone.now(), settings.OUTBOX_BATCH_SIZE]))
+
+
+def drain_outbox():
+
+    """
+    Send every message that is due, a batch at a time over a single
+    connection to the mail server. Each batch is locked and marked in its
+    own transaction, so a message can be sent twice if the process dies
+    mid-batch, but is never lost.
+
+    A message that can't be sent is tried again after retry_delay(), and
+    marked as dead after OUTBOX_MAX_ATTEMPTS. Returns the sent, retried and
+    dead counts, the messages sent per second and the longest time a sent
+    message waited in the outbox.
+    """
+
+    stats = {"sent": 0, "retried": 0, "dead": 0, "lag": 0.0}
+    started = time.monotonic()
+    mail_connection = get_connection()
+
+    try:
+        while True:
+            with transaction.atomic():
+                batch = claim_batch()
+
+                if not batch:
+                    break
+
+                sent_ids = []
+
+                for message in batch:
+                    try:
+                        mail_connection.open()
+                        mail_connection.send_messages([
+                            EmailMessage(message.subject, message.body, from_email=message.from_email, to=json.loads(message.to))
+                        ])
+
+                    except Exception:
+                        failed(message, traceback.format_exc())
+                        stats["dead" if message.status == OutboxMessage.DEAD else "retried"] += 1
+
+                        # Start again with a fresh connection for the next message
+                        mail_connection.close()
+
+                    else:
+                        sent_ids.append(message.pk)
+                        stats["lag"] = max(stats["lag"], (timezone.now() - message.created_on).total_seconds())
+
+                OutboxMessage.objects.filter(pk__in=sent_ids).update(status=OutboxMessage.SENT, sent_on=timezone.now())
+                stats["sent"] += len(sent_ids)
+
+    finally:
+        mail_connection.close()
+
+    elapsed = time.monotonic() - started
+    stats["per_second"] = stats["sent"] / elapsed if elapsed else 0.0
+
+    if stats["sent"] or stats["retried"] or stats["dead"]:
+        logger.info("Sent %(sent)d emails (%(per_second).1f/s, longest wait %(lag).1fs), %(retried)d to retry, %(dead)d dead", stats)
+
+    # Come back for the messages that are waiting to be retried. In eager
+    # mode that would happen straight away, so they wait for the next drain.
+    next_attempt_at = OutboxMessage.objects.filter(status=OutboxMessage.PENDING).aggregate(Min("next_attempt_at"))["next_attempt_at__min"]
+
+    if next_attempt_at is not None and not settings.JOBS_ALWAYS_EAGER:
+        schedule_drain(max(next_attempt_at - timezone.now(), timedelta()))
+
+    return stats
+
+
+def failed(message, error):
+
+    """
+    Record a failed attempt at sending message.
+    """
+
+    message.attempts += 1
+    message.last_error = error
+
+    if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        logger.error("Giving up on email %d (%s) after %d attempts:\n%s", message.pk, message.subject, message.attempts, error)
+        message.status = OutboxMessage.DEAD
+
+    else:
+        logger.warning("Could not send email %d (%s), trying again later:\n%s", message.pk, message.subject, error)
+        message.next_attempt_at = timezone.now() + retry_delay(message.attempts)
+
+    message.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def requeue_dead():
+
+    """
+    Give the dead messages another full set of attempts. Returns how many there were.
+    """
+
+    count = OutboxMessage.objects.filter(status=OutboxMessage.DEAD).update(
+        status=OutboxMessage.PENDING, attempts=0, next_attempt_at=timezone.now())
+
+    if count:
+        schedule_drain()
+
+    return count
+
+
+def outbox_metrics():
+
+    """
+    The number of pending and dead messages, how long the oldest pending
+    message has waited in seconds, and the number of messages sent in the
+    last hour along with the average seconds they waited.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                count(*) FILTER (WHERE status = %s),
+                count(*) FILTER (WHERE status = %s),
+                EXTRACT(EPOCH FROM %s - min(created_on) FILTER (WHERE status = %s))
+            FROM outbox_message
+            WHERE status IN (%s, %s)
+        """, [OutboxMessage.PENDING, OutboxMessage.DEAD, timezone.now(), OutboxMessage.PENDING,
+              OutboxMessage.PENDING, OutboxMessage.DEAD])
+        pending, dead, oldest_pending = cursor.fetchone()
+
+        cursor.execute("""
+            SELECT count(*), EXTRACT(EPOCH FROM avg(sent_on - created_on))
+            FROM outbox_message
+            WHERE status = %s AND sent_on > %s
+        """, [OutboxMessage.SENT, timezone.now() - timedelta(hours=1)])
+        sent_last_hour, average_lag = cursor.fetchone()
+
+    return {
+        "pending": pending,
+        "dead": dead,
+        "oldest_pending": float(oldest_pending) if oldest_pending is not None else None,
+        "sent_last_hour": sent_last_hour,
+        "average_lag": float(average_lag) if average_lag is not None else None,
+    }
@@ -0,0 +1,192 @@
+import json
+from datetime import timedelta
+from smtplib import SMTPException
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from its.jobs.models import Job, OutboxMessage, enqueue, claim_job, run_job, run_pending, retry_delay
+from its.jobs.outbox import queue_email, drain_outbox, requeue_dead, outbox_metrics
+from unittest.mock import patch
+
+calls = []
+
+
+def record(*args):
+    calls.append(args)
+
+
+def explode():
+    raise RuntimeError("Boom")
+
+
+@override_settings(JOBS_ALWAYS_EAGER=False, JOBS_MAX_ATTEMPTS=2, JOBS_RETRY_DELAY=30)
+class JobTest(TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    @override_settings(JOBS_ALWAYS_EAGER=True)
+    def test_enqueue_eager(self):
+
+        """
+        Check that jobs run straight away in eager mode, without being stored.
+        """
+
+        self.assertIsNone(enqueue(record, 1, "a"))
+        self.assertEqual(calls, [(1, "a")])
+        self.assertFalse(Job.objects.exists())
+
+    def test_enqueue(self):
+
+        """
+        Check that jobs are stored with their arguments and only run by a worker.
+        """
+
+        job = enqueue(record, 1, "a")
+
+        self.assertEqual(job.task, "its.jobs.tests.record")
+        self.assertEqual(json.loads(job.args), [1, "a"])
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [(1, "a")])
+
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claim(self):
+
+        """
+        Check that jobs are claimed once, in order, and only when they are due.
+        """
+
+        later = enqueue(record, 2, delay=timedelta(hours=1))
+        first = enqueue(record, 1)
+
+        job = claim_job()
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertIsNone(claim_job())
+
+        # A job whose worker died is picked up again once its lock times out
+        Job.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_job().pk, first.pk)
+
+        Job.objects.filter(pk=later.pk).update(run_at=timezone.now())
+        self.assertEqual(claim_job().pk, later.pk)
+
+    def test_retry(self):
+
+        """
+        Check that a failing job is retried after a delay, then marked as failed.
+        """
+
+        job = enqueue(explode)
+
+        self.assertFalse(run_job(claim_job()))
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn("RuntimeError: Boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=25))
+        self.assertIsNone(claim_job())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertFalse(run_job(claim_job()))
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNone(claim_job())
+
+    def test_retry_delay(self):
+        self.assertEqual(retry_delay(1), timedelta(seconds=30))
+        self.assertEqual(retry_delay(3), timedelta(seconds=120))
+
+
+def message(subject):
+    return EmailMessage(subject, "Body", from_email="from@example.com", to=["to@example.com"])
+
+
+@override_settings(JOBS_ALWAYS_EAGER=False, OUTBOX_BATCH_SIZE=2, OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_DELAY=60)
+class OutboxTest(TestCase):
+
+    @override_settings(JOBS_ALWAYS_EAGER=True)
+    def test_queue_email_eager(self):
+
+        """
+        Check that in eager mode messages are sent straight away.
+        """
+
+        queue_email(message("One"))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "One")
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.SENT)
+
+    def test_drain(self):
+
+        """
+        Check that queued messages are sent in order, over one connection,
+        with a single drain job queued for all of them.
+        """
+
+        queue_email(message("One"), message("Two"))
+        queue_email(message("Three"))
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.count(), 1)
+
+        with patch("its.jobs.outbox.get_connection", side_effect=get_connection) as connect:
+            stats = drain_outbox()
+
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual([m.subject for m in mail.outbox], ["One", "Two", "Three"])
+        self.assertEqual(mail.outbox[0].to, ["to@example.com"])
+        self.assertEqual(stats["sent"], 3)
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+
+        metrics = outbox_metrics()
+        self.assertEqual(metrics["pending"], 0)
+        self.assertEqual(metrics["sent_last_hour"], 3)
+
+    def test_retry_and_dead_letter(self):
+
+        """
+        Check that a message that can't be sent is retried later without
+        holding up the others, then given up on and can be requeued.
+        """
+
+        def send_messages(backend, messages):
+            if messages[0].subject == "Bad":
+                raise SMTPException("Relay unavailable")
+
+            mail.outbox.extend(messages)
+            return len(messages)
+
+        queue_email(message("Bad"), message("Good"))
+
+        with patch.object(EmailBackend, "send_messages", autospec=True, side_effect=send_messages):
+            self.assertEqual(run_pending(), 1)
+            self.assertEqual([m.subject for m in mail.outbox], ["Good"])
+
+            bad = OutboxMessage.objects.get(subject="Bad")
+            self.assertEqual(bad.status, OutboxMessage.PENDING)
+            self.assertIn("Relay unavailable", bad.last_error)
+            self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+            # A drain is queued for when the message is due again
+            self.assertTrue(Job.objects.filter(status=Job.QUEUED, run_at__gte=bad.next_attempt_at).exists())
+            self.assertEqual(drain_outbox()["retried"], 0)
+
+            OutboxMessage.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(drain_outbox()["dead"], 1)
+            self.assertEqual(outbox_metrics()["dead"], 1)
+
+        self.assertEqual(requeue_dead(), 1)
+        drain_outbox()
+        self.assertEqual([m.subject for m in mail.outbox], ["Good", "Bad"])
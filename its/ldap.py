@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import ldap3
+from ldap3.core.exceptions import LDAPException, LDAPCommunicationError
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class LDAPPoolTimeout(LDAPException):
+    pass
+
+
+class LDAPPool:
+
+    """
+    A pool of bound, read only connections to one of the servers in
+    settings.LDAP. Connections are kept open between searches, so a search
+    costs one round trip instead of a TCP (and TLS) handshake, a bind and a
+    search.
+
+    At most LDAP_POOL_SIZE connections are open at once. Callers wait up to
+    LDAP_POOL_WAIT seconds for one to come free. A connection that has been
+    idle for LDAP_HEALTH_CHECK_AFTER seconds is checked with a cheap root DSE
+    read before it is handed out, and replaced if the server dropped it.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.config = settings.LDAP[using]
+        self.size = self.config.get('pool_size', settings.LDAP_POOL_SIZE)
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        # (connection, time it was released) pairs, most recently used last
+        self.idle = []
+
+    def connect(self):
+        host = self.config['host']
+        server = ldap3.Server(host, use_ssl=host.startswith('ldaps://'), connect_timeout=settings.LDAP_CONNECT_TIMEOUT)
+
+        return ldap3.Connection(
+            server,
+            user=self.config.get('username'),
+            password=self.config.get('password'),
+            auto_bind=True,
+            read_only=True,
+            receive_timeout=settings.LDAP_RECEIVE_TIMEOUT,
+        )
+
+    def is_healthy(self, connection, idle_since):
+        if connection.closed or not connection.bound:
+            return False
+
+        if time.monotonic() - idle_since < settings.LDAP_HEALTH_CHECK_AFTER:
+            return True
+
+        try:
+            return connection.search('', '(objectClass=*)', search_scope=ldap3.BASE, attributes=['1.1'])
+        except LDAPException:
+            return False
+
+    def acquire(self):
+
+        """
+        Take a healthy connection from the pool, opening a new one if there
+        are no idle ones.
+        """
+
+        if not self.slots.acquire(timeout=settings.LDAP_POOL_WAIT):
+            raise LDAPPoolTimeout('No %s LDAP connection came free within %s seconds' % (self.using, settings.LDAP_POOL_WAIT))
+
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+
+                    connection, idle_since = self.idle.pop()
+
+                if self.is_healthy(connection, idle_since):
+                    return connection
+
+                self.discard(connection)
+
+            return self.connect()
+
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, connection):
+        with self.lock:
+            self.idle.append((connection, time.monotonic()))
+
+        self.slots.release()
+
+    def discard(self, connection):
+        try:
+            connection.unbind()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+
+        """
+        A connection for the duration of the with block. A connection that
+        lost touch with the server is closed instead of going back in the pool.
+        """
+
+        connection = self.acquire()
+        broken = False
+
+        try:
+            yield connection
+
+        except LDAPCommunicationError:
+            broken = True
+            raise
+
+        finally:
+            if broken:
+                self.discard(connection)
+                self.slots.release()
+
+            else:
+                self.release(connection)
+
+    def search(self, query, attributes=ldap3.ALL_ATTRIBUTES, **kwargs):
+
+        """
+        Search under the server's search_dn. If the connection turns out to
+        be broken the search is made once more on a new one.
+        """
+
+        for attempt in (1, 2):
+            try:
+                with self.connection() as connection:
+                    connection.search(self.config['search_dn'], query, attributes=attributes, **kwargs)
+                    return [(entry['dn'], entry['attributes']) for entry in connection.response if entry.get('type') == 'searchResEntry']
+
+            except LDAPCommunicationError:
+                if attempt == 2:
+                    raise
+
+                logger.warning('LDAP search on %s failed, reconnecting', self.using, exc_info=True)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+
+        for connection, idle_since in idle:
+            self.discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def get_pool(using='default'):
+
+    """
+    The pool for one of the servers in settings.LDAP. A process forked after
+    pools were created (by the web server, for example) starts new ones
+    rather than sharing the parent's sockets.
+    """
+
+    global _pools_pid
+
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+
+        if using not in _pools:
+            _pools[using] = LDAPPool(using)
+
+        return _pools[using]
+
+
+def ldapsearch(query, using='default', **kwargs):
+
+    """
+    A drop in replacement for arcutils.ldap.ldapsearch that uses the pooled
+    connections. Returns a list of (dn, attributes) pairs.
+    """
+
+    return get_pool(using).search(query, **kwargs)
+
+
+class TTLCache:
+
+    """
+    A small per-process cache for answers looked up in LDAP. Entries expire
+    ttl seconds after they are set, and the oldest ones are dropped once
+    there are more than max_size.
+    """
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # key -> (expires at, value), oldest first
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return default
+
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return default
+
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
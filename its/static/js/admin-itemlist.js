@@ -2,9 +2,34 @@ $(function() {
 
   var masterCheckbox = $('#select_all');
   var slaveCheckboxes = $('.checkbox_archive');
+  var changedIds = $('#id_changed_ids');
+
+  changedIds.prop('disabled', false);
+
+  // Keep track of the items whose checkbox was toggled, so only those are changed.
+  function markChanged(checkboxes) {
+    var ids = changedIds.val() ? changedIds.val().split(',') : [];
+
+    checkboxes.each(function() {
+      if ($.inArray(this.value, ids) === -1) {
+        ids.push(this.value);
+      }
+    });
+
+    changedIds.val(ids.join(','));
+  }
 
   masterCheckbox.click(function() {
     slaveCheckboxes.prop('checked', masterCheckbox.prop('checked'));
+    markChanged(slaveCheckboxes);
+  });
+
+  slaveCheckboxes.change(function() {
+    markChanged($(this));
+  });
+
+  $('#select_all_actions').click(function() {
+    $('.checkbox_select').prop('checked', $(this).prop('checked'));
   });
 
 });
\ No newline at end of file
@@ -0,0 +1,31 @@
+function initItemSearch(selector, searchUrl, actionUrl){
+    selector.typeahead({
+        minLength: 2,
+        highlight: true
+    }, {
+            name: "items",
+            source: function (query, callback) {
+                $.getJSON(searchUrl, {query: query}, function (data) {
+                    callback(data);
+                });
+            },
+            displayKey: "description",
+            templates: {
+                        suggestion: function (context) {
+                            return $('<p></p>').text(
+                                '#' + context.id + ' ' + context.description + ' - ' +
+                                context.category + ', ' + context.location + ' (' + context.status + ')'
+                            ).prop('outerHTML');
+                        }
+            }
+        })
+
+        // Go straight to the item when a suggestion is picked.
+        selector.on('typeahead:selected', function (object, datum) {
+            window.location = actionUrl.replace('/0/', '/' + datum.id + '/');
+        });
+}
+
+$(function(){
+    initItemSearch($("#id_keyword_or_last_name"), itemSearchUrl, itemActionUrl);
+});
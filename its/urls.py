@@ -18,9 +18,12 @@ urlpatterns = patterns(
     url(r'^items/admin-action/(?P<item_num>\d+)/$', items.adminaction, name='admin-action'),
     url(r'^$', items.checkin, name='index'),
     url(r'^items/checkin$', items.checkin, name='checkin'),
+    url(r'^items/bulk-checkin$', items.bulk_checkin, name='bulk-checkin'),
     url(r'^items/admin-itemlist$', items.admin_itemlist, name='admin-itemlist'),
+    url(r'^items/reports$', items.reports, name='reports'),
     url(r'^items/itemlist$', items.itemlist, name='itemlist'),
     url(r'^items/autocomplete/?$', items.autocomplete, name='users-autocomplete'),
+    url(r'^items/search/?$', items.item_search, name='items-search'),
     url(r'^items/(?P<item_id>\d+)/$', items.printoff, name='printoff'),
     url(r'^accounts/login/$', 'djangocas.views.login', name='login'),
     url(r'^accounts/logout/$', 'djangocas.views.logout', name='logout'),
@@ -0,0 +1,132 @@
+from datetime import datetime
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from arcutils.ldap import parse_profile
+from its.ldap import get_pool
+from its.users.models import DirectoryEntry
+
+
+def ldap_timestamp(value):
+
+    """
+    Turn a modifyTimestamp attribute, such as ['20150312184500Z'], into an aware datetime.
+    """
+
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+
+    if value is None or isinstance(value, datetime):
+        return value
+
+    return datetime.strptime(value[:14], "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = 'Copies the people in the campus LDAP directory into the directory_entry table.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--full', action='store_true', default=False,
+                    help='Copy every entry and remove the people who are no longer in LDAP, '
+                         'instead of only the entries modified since the last sync.'),
+        make_option('--page-size', type='int', default=500,
+                    help='Number of entries to ask LDAP for at a time.'),
+    )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        since = None if options['full'] else DirectoryEntry.objects.aggregate(Max('modified_on'))['modified_on__max']
+
+        if since is None:
+            query = '(uid=*)'
+            self.stdout.write('Copying the whole directory...')
+
+        else:
+            # modifyTimestamp only has whole seconds, so entries changed in
+            # the same second as the last sync are copied again. That's harmless.
+            query = '(&(uid=*)(modifyTimestamp>=%s))' % since.astimezone(timezone.utc).strftime("%Y%m%d%H%M%SZ")
+            self.stdout.write('Copying the entries modified since %s...' % since)
+
+        count = 0
+        batch = []
+
+        for entry in self.entries(query, options['page_size']):
+            batch.append(entry)
+
+            if len(batch) == options['page_size']:
+                count += self.save(batch, started)
+                batch = []
+
+        count += self.save(batch, started)
+        self.stdout.write('Copied %d entries' % count)
+
+        # A full sync saw everyone, so anybody it didn't touch has left
+        if since is None:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM directory_entry WHERE synced_on < %s", [started])
+                self.stdout.write('Removed %d entries' % cursor.rowcount)
+
+    def entries(self, query, page_size):
+
+        """
+        The search results as dicts of DirectoryEntry fields, read from LDAP a page at a time.
+        """
+
+        pool = get_pool('default')
+
+        with pool.connection() as ldap:
+            results = ldap.extend.standard.paged_search(
+                search_base=pool.config['search_dn'],
+                search_filter=query,
+                attributes=['*', 'modifyTimestamp'],
+                paged_size=page_size,
+                generator=True,
+            )
+
+            for result in results:
+                if result.get('type') != 'searchResEntry':
+                    continue
+
+                attributes = result['attributes']
+                profile = parse_profile(attributes)
+
+                yield {
+                    'uid': attributes['uid'][0].lower(),
+                    'first_name': profile['first_name'] or '',
+                    'last_name': profile['last_name'] or '',
+                    'email': profile['email'] or '',
+                    'modified_on': ldap_timestamp(attributes.get('modifyTimestamp')),
+                }
+
+    def save(self, batch, synced_on):
+
+        """
+        Insert or update a batch of entries with a single statement.
+        """
+
+        if not batch:
+            return 0
+
+        # The same person can't appear twice in one INSERT ... ON CONFLICT
+        batch = list(dict((entry['uid'], entry) for entry in batch).values())
+        columns = ['uid', 'first_name', 'last_name', 'email', 'modified_on']
+        params = []
+
+        for entry in batch:
+            params.extend([entry[column] for column in columns] + [synced_on])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO directory_entry (uid, first_name, last_name, email, modified_on, synced_on)
+                VALUES %s
+                ON CONFLICT (uid) DO UPDATE SET
+                    first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    email = EXCLUDED.email,
+                    modified_on = EXCLUDED.modified_on,
+                    synced_on = EXCLUDED.synced_on
+            """ % ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch)), params)
+
+        return len(batch)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20150226_1314'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectoryEntry',
+            fields=[
+                ('directory_entry_id', models.AutoField(primary_key=True, serialize=False)),
+                ('uid', models.CharField(max_length=255, unique=True)),
+                ('first_name', models.CharField(max_length=255)),
+                ('last_name', models.CharField(max_length=255)),
+                ('email', models.CharField(max_length=255)),
+                ('modified_on', models.DateTimeField(null=True, db_index=True)),
+                ('synced_on', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'directory_entry',
+                'ordering': ['uid'],
+            },
+            bases=(models.Model,),
+        ),
+        # The unique index on uid uses the database collation, which can't
+        # answer LIKE 'abc%'. Uids are stored in lower case, so prefix
+        # lookups are a range scan on this one.
+        migrations.RunSQL(
+            "CREATE INDEX directory_entry_uid_prefix_idx ON directory_entry (uid varchar_pattern_ops)",
+            reverse_sql="DROP INDEX directory_entry_uid_prefix_idx",
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_directoryentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameCounter',
+            fields=[
+                ('base', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('last_suffix', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'username_counter',
+            },
+            bases=(models.Model,),
+        ),
+        # Start each base after the highest suffix create_user already gave
+        # out. A base that itself ends in digits may be split in the wrong
+        # place, which create_user copes with by trying the next suffix.
+        migrations.RunSQL("""
+INSERT INTO username_counter (base, last_suffix)
+SELECT substring(username FROM '^(.*?)[0-9]+$'), max(substring(username FROM '([0-9]+)$')::bigint)
+FROM "user"
+WHERE left(username, 1) = '_' AND username ~ '[0-9]$' AND NOT is_active
+GROUP BY 1
+HAVING max(substring(username FROM '([0-9]+)$')::bigint) < 2147483647
+""", reverse_sql="DELETE FROM username_counter"),
+    ]
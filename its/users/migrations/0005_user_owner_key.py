@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_usernamecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='owner_key',
+            field=models.CharField(max_length=767, null=True, editable=False),
+            preserve_default=True,
+        ),
+        # Give each existing owner a key. Where the same person was already
+        # recorded more than once only the oldest record gets it, and that
+        # is the one found from now on.
+        migrations.RunSQL("""
+UPDATE "user" SET owner_key = keyed.owner_key
+FROM (
+    SELECT DISTINCT ON (owner_key) user_id, owner_key
+    FROM (
+        SELECT user_id, lower(btrim(email)) || E'\\t' || lower(btrim(first_name)) || E'\\t' || lower(btrim(last_name)) AS owner_key
+        FROM "user"
+        WHERE NOT is_active
+    ) AS owners
+    ORDER BY owner_key, user_id
+) AS keyed
+WHERE "user".user_id = keyed.user_id
+""", reverse_sql='UPDATE "user" SET owner_key = NULL'),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX user_owner_key_idx ON "user" (owner_key) WHERE NOT is_active',
+            reverse_sql="DROP INDEX user_owner_key_idx",
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, connection
 from django.contrib.auth.models import AbstractBaseUser, UserManager
 
 
@@ -15,6 +15,11 @@ class User(AbstractBaseUser):
     is_active = models.BooleanField(default=True, blank=True, help_text="Inactive users cannot login")
     # for staff set to true.
     is_staff = models.BooleanField(default=False, blank=True)
+    # Identifies an inactive owner record by their email and name, see
+    # owner_key(). Unique among inactive users, so the same person isn't
+    # recorded twice. Set when an owner is created, and kept up to date if
+    # they had one.
+    owner_key = models.CharField(max_length=767, null=True, editable=False)
 
     USERNAME_FIELD = 'username'
 
@@ -24,6 +29,14 @@ class User(AbstractBaseUser):
         db_table = "user"
         ordering = ['last_name', 'first_name']
 
+    def save(self, *args, **kwargs):
+        if self.is_active:
+            self.owner_key = None
+        elif self.pk is None or self.owner_key is not None:
+            self.owner_key = owner_key(self.first_name, self.last_name, self.email)
+
+        super(User, self).save(*args, **kwargs)
+
     #
     # These methods are required to work with Django's admin
     #
@@ -46,3 +59,78 @@ class User(AbstractBaseUser):
             return self.get_full_name()
         else:
             return self.email
+
+
+def owner_key(first_name, last_name, email):
+
+    """
+    The normalized identity of an owner: their email and name, trimmed and
+    in lower case, so "Jane Doe <Jane@PDX.edu>" and "jane doe <jane@pdx.edu>"
+    are the same person.
+    """
+
+    return "\t".join(value.strip().lower() for value in (email, first_name, last_name))
+
+
+class UsernameCounter(models.Model):
+    # The last numeric suffix handed out for each generated username base,
+    # such as "_JaneDoe", so the next one can be allocated without looking
+    # at the existing users.
+    base = models.CharField(max_length=255, primary_key=True)
+    last_suffix = models.IntegerField()
+
+    class Meta:
+        db_table = "username_counter"
+
+
+def allocate_username(base):
+
+    """
+    The next unused username for base, "_JaneDoe0", "_JaneDoe1" and so on,
+    in one statement. The counter row stays locked until the transaction
+    ends, so concurrent allocations for the same base never get the same name.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO username_counter (base, last_suffix) VALUES (%s, 0)
+            ON CONFLICT (base) DO UPDATE SET last_suffix = username_counter.last_suffix + 1
+            RETURNING last_suffix
+        """, [base])
+
+        return base + str(cursor.fetchone()[0])
+
+
+class DirectoryEntry(models.Model):
+    # A local copy of a person in the campus LDAP directory, kept up to date
+    # by manage.py syncdirectory. Username lookups use this table instead of
+    # LDAP when settings.USE_DIRECTORY_MIRROR is set.
+    directory_entry_id = models.AutoField(primary_key=True)
+    uid = models.CharField(max_length=255, unique=True)
+    first_name = models.CharField(max_length=255)
+    last_name = models.CharField(max_length=255)
+    email = models.CharField(max_length=255)
+    # The entry's modifyTimestamp in LDAP
+    modified_on = models.DateTimeField(null=True, db_index=True)
+    synced_on = models.DateTimeField()
+
+    class Meta:
+        db_table = "directory_entry"
+        ordering = ['uid']
+
+    def __str__(self):
+        return self.uid
+
+    def profile(self):
+
+        """
+        The same fields the username autocomplete gets from an LDAP profile.
+        """
+
+        return {
+            'odin': self.uid,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'full_name': (self.first_name + " " + self.last_name).strip(),
+            'email': self.email,
+        }